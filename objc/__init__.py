@@ -1,8 +1,20 @@
+import importlib
+import sys
+
 from . import api
 from .api import *
-from . import classes
-from . import protocols
 from . import defs
 
 __all__ = sorted(("api", "classes", "protocols", *api.__all__))
 
+# objc.classes and objc.protocols are only imported when they are first accessed. Module __getattr__ is only supported since Python 3.7, so they are imported eagerly on older versions.
+
+if sys.version_info < (3, 7):
+	from . import classes
+	from . import protocols
+
+def __getattr__(name):
+	if name in ("classes", "protocols"):
+		return importlib.import_module("." + name, __name__)
+	
+	raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -2,7 +2,10 @@ import builtins
 import collections
 import collections.abc
 import ctypes
+import functools
 import importlib
+import importlib.util
+import logging
 import sys
 import threading
 import traceback
@@ -43,6 +46,8 @@ __all__ = [
 
 SHORT_PROPERTIES = False
 
+_log = logging.getLogger(__name__)
+
 # Install the loaders for objc.classes and objc.protocols (can only be used once Class and Protocol has been defined, respectively).
 
 class _ClassModuleProxy(type(sys)):
@@ -86,31 +91,34 @@ _MODULE_PROXIES = {
 	"objc.protocols": _ProtocolModuleProxy,
 }
 
+# Names that are added to the known names of objc.classes and objc.protocols when they are created, so that objc.defs can register names without importing the modules.
+_preloaded_names = {name: set() for name in _MODULE_PROXIES}
+
 class _ObjcSpecialFinderLoader(object):
-	def find_module(self, fullname, path=None):
-		return self if fullname in _MODULE_PROXIES else None
+	def find_spec(self, fullname, path=None, target=None):
+		return importlib.util.spec_from_loader(fullname, self) if fullname in _MODULE_PROXIES else None
 	
-	def load_module(self, fullname):
-		mod = sys.modules.setdefault(fullname, _MODULE_PROXIES[fullname](fullname))
+	def create_module(self, spec):
+		mod = _MODULE_PROXIES[spec.name](spec.name)
+		mod._known_names.update(_preloaded_names[spec.name])
 		mod.__file__ = "<dynamically created by {cls.__module__}.{cls.__qualname__}>".format(cls=type(self))
-		mod.__loader__ = self
-		mod.__package__ = "objc"
 		mod.__all__ = ["DontEvenTryToStarImportThisModuleYouCrazyPerson"]
 		return mod
+	
+	def exec_module(self, module):
+		pass
 
-# Remove old versions of the loader and modules if the objc module is reloaded.
+# Remove old versions of the loader and modules if the objc module is reloaded. A reload keeps the module's globals, so the old loader is still available under its name.
 
-for obj in sys.meta_path:
-	if type(obj).__module__ == "objc.api" and type(obj).__name__ == "_ObjcSpecialFinderLoader":
-		sys.meta_path.remove(obj)
-		break
-del obj
+try:
+	sys.meta_path.remove(_finder_loader)
+except (NameError, ValueError):
+	pass
 
-sys.meta_path.append(_ObjcSpecialFinderLoader())
+_finder_loader = _ObjcSpecialFinderLoader()
+sys.meta_path.append(_finder_loader)
 sys.modules.pop("objc.classes", None)
 sys.modules.pop("objc.protocols", None)
-from . import classes
-from . import protocols
 
 ##__all__ = [] # TODO
 
@@ -119,7 +127,9 @@ LP64 = sys.maxsize > 2**31 - 1
 ffi = cffi.FFI(backend=cffi.backend_ctypes.CTypesBackend())
 libc = ffi.dlopen(None)
 
-ffi.cdef("""
+# All runtime declarations are collected first and passed to a single cdef call.
+# Every cdef call runs the CFFI parser again (including a preamble for all previously declared typedefs), and with the ctypes backend this happens on every import.
+_cdefs = ["""
 // Lots of standard C definitions.
 // Also redefine all the standard integer types.
 // Most of them are defined by CFFI automatically, but that can't always be trusted with the ctypes backend.
@@ -193,11 +203,7 @@ typedef union DGUnknownUnion unknown_union;
 // Placeholders for the return type and argument list of a polymorphic function that has not been cast to a concrete signature.
 typedef struct DGUncastPolymorphicReturn uncast_polymorphic_return;
 typedef struct DGUncastPolymorphicArguments uncast_polymorphic_arguments;
-""")
-
-ffi.cdef("typedef bool BOOL;" if LP64 else "typedef signed char BOOL;")
-
-ffi.cdef("""
+""", "typedef bool BOOL;" if LP64 else "typedef signed char BOOL;", """
 
 // Types
 
@@ -407,11 +413,11 @@ extern struct objc_method_description protocol_getMethodDescription(Protocol *p,
 extern const char *protocol_getName(Protocol *p);
 extern objc_property_t protocol_getProperty(Protocol *proto, const char *name, BOOL isRequiredProperty, BOOL isInstanceProperty);
 extern BOOL protocol_isEqual(Protocol *proto, Protocol *other);
-""")
+"""]
 
 if not LP64:
 	# On 32-bit ARM, we need to use the stret versions of these functions when the return type is something other than an integer (including booleans and enums) or a floating-point number.
-	ffi.cdef("""
+	_cdefs.append("""
 	extern IMP class_getMethodImplementation_stret(Class cls, SEL name);
 	
 	extern uncast_polymorphic_return _objc_msgForward_stret(id receiver, SEL sel, uncast_polymorphic_arguments args);
@@ -420,6 +426,9 @@ if not LP64:
 	extern uncast_polymorphic_return method_invoke_stret(id receiver, Method m, uncast_polymorphic_arguments args);
 	""")
 
+ffi.cdef("\n".join(_cdefs))
+del _cdefs
+
 void = ffi.typeof("void")
 INTEGER_TYPES = (
 	ffi.typeof("signed char"),
@@ -434,6 +443,13 @@ INTEGER_TYPES = (
 	ffi.typeof("unsigned long long"),
 )
 
+# Frequently used ctypes, looked up once here instead of on every use.
+# ffi.typeof internally acquires a (non-reentrant) lock, which makes it slow and deadlock-prone when called from a __del__ method.
+_TP_ID, _TP_CLASS, _TP_PROTO_P, _TP_FLOAT, _TP_DOUBLE, _TP_CHAR, _TP_BOOL, _TP_SEL, _TP_UINTPTR = map(ffi.typeof, ("id", "Class", "Protocol *", "float", "double", "char", "bool", "SEL", "uintptr_t"))
+_TP_IVAR, _TP_METHOD, _TP_PROPERTY = map(ffi.typeof, ("Ivar", "Method", "objc_property_t"))
+_TP_UNKNOWN_TYPE, _TP_UNKNOWN_STRUCT, _TP_UNKNOWN_UNION = map(ffi.typeof, ("unknown_type", "unknown_struct", "unknown_union"))
+_TP_CHAR_P, _TP_BLOCK_INVOKE = map(ffi.typeof, ("char *", "uncast_polymorphic_return (*)(id self, uncast_polymorphic_arguments args)"))
+
 def free(ptr):
 	"""Free the given pointer, as returned by C malloc. If it is NULL, nothing happens."""
 	
@@ -443,20 +459,56 @@ def gc_free(ptr):
 	"""Return a copy of the given pointer which automatically frees itself (and the original) when the copy is garbage-collected."""
 	
 	return ffi.gc(ptr, free)
+
+# Per-thread unsigned int cell for the outCount arguments of the *copy*List functions.
+_scratch = threading.local()
+
+def _scratch_count_ptr():
+	"""Return this thread's reusable unsigned int * for receiving a count from the Objective-C runtime.
 	
+	The value must be read out right after the call that fills it in, before anything else can reuse the cell.
+	"""
+	
+	try:
+		return _scratch.count_ptr
+	except AttributeError:
+		count_ptr = _scratch.count_ptr = ffi.new("unsigned int *")
+		return count_ptr
+	
+# Number of colons in the name of each known SEL cdata, i. e. the number of arguments it takes. Only valid (mapped) selectors are added, so a SEL in this dict needs no sel_isMapped check.
+_sel_colon_counts = {}
+
+def _sel_register(name):
+	"""Register the selector with the given name (bytes) and return it as a SEL cdata.
+	
+	Selector names are cached by Selector, use Selector(name) instead of calling this directly."""
+	
+	sel = libc.sel_registerName(name)
+	_sel_colon_counts[sel] = name.count(b":")
+	return sel
+
+def _sel_colon_count(sel):
+	"""Return the number of colons in the name of the given SEL cdata."""
+	
+	try:
+		return _sel_colon_counts[sel]
+	except KeyError:
+		count = _sel_colon_counts[sel] = ffi.string(libc.sel_getName(sel)).count(b":")
+		return count
+
 def _retain(ptr):
 	"""Send a retain message to the given id cdata.
 	
 	Do not call directly, ID retains and releases objects automatically."""
 	
-	_objc_msgSend_retain(ptr, libc.sel_registerName(b"retain"))
+	_get_polymorphic("objc_msgSend", _TP_ID, (_TP_ID, _TP_SEL))(ptr, _SEL_RETAIN)
 
 def _release(ptr):
 	"""Send a release message to the given id cdata. The object cannot be used anymore afterwards.
 	
 	Do not call directly, ID retains and releases objects automatically."""
 	
-	_objc_msgSend_release(ptr, libc.sel_registerName(b"release"))
+	_get_polymorphic("objc_msgSend", void, (_TP_ID, _TP_SEL))(ptr, _SEL_RELEASE)
 
 def _gc_release(ptr):
 	"""Return a copy of the given pointer which automatically releases itself (and the original) when the copy is garbage-collected.
@@ -466,59 +518,96 @@ def _gc_release(ptr):
 	
 	return ffi.gc(ptr, _release)
 
+def _paddr(ptr):
+	"""Return the address of the given pointer cdata as an int. Unlike cdata, ints are cheap to hash and compare, so this is used for cache keys and pointer comparisons in hot paths."""
+	
+	return int(ffi.cast(_TP_UINTPTR, ptr))
+
+def _raise_type_error(cls, arg, expected):
+	"""Raise a TypeError because arg, which was passed to the constructor of cls, has an unsupported type. expected describes the supported values, and may refer to cls as {cls}."""
+	
+	raise TypeError("Expected {}, not {tp.__module__}.{tp.__qualname__}".format(expected.format(cls=cls), tp=type(arg)))
+
+def _weak_cache_get(cache, key):
+	"""Return the object cached under key in the given dict of weak references, or None if there is none or it has died."""
+	
+	ref = cache.get(key)
+	return None if ref is None else ref()
+
+def _weak_cache_setdefault(cache, key, obj):
+	"""Cache a weak reference to obj under key in the given dict, unless another live object is already cached there. Return the object that is cached afterwards.
+	
+	The entry is removed automatically when the object dies.
+	"""
+	
+	def _remove(ref):
+		# Only remove the entry if it hasn't been replaced by a newer object with the same key.
+		if cache.get(key) is ref:
+			cache.pop(key, None)
+	
+	ref = weakref.ref(obj, _remove)
+	existing = cache.setdefault(key, ref)
+	if existing is not ref:
+		other = existing()
+		if other is not None:
+			return other
+		
+		# The cached object has died, but its entry has not been removed yet.
+		cache[key] = ref
+	
+	return obj
+
+def _cached_wrapper(cls, ptr, retain):
+	"""Return the existing instance of cls (an ID subclass) that wraps the object at ptr (an id cdata), or None if there is none.
+	
+	If an instance is returned and retain is false, the object is released once, following the rules described in ID.__new__.
+	"""
+	
+	self = _weak_cache_get(ID._cache, _paddr(ptr))
+	if isinstance(self, cls):
+		if not retain:
+			_release(self.cdata)
+		return self
+	else:
+		return None
+
+_ADDRESS_FORMAT = "0x{:016x}" if LP64 else "0x{:08x}"
+
 def format_address(addr):
 	"""Format the given address (an integer or a cdata castable to uintptr_t) in hex representation as a string. The representation is 16 hex digits long in a 64-bit environment, and 8 hex digits long otherwise."""
 	
-	try:
-		ffi.typeof(addr)
-	except TypeError:
-		pass
-	else:
-		addr = int(ffi.cast("uintptr_t", addr))
+	if not isinstance(addr, int):
+		addr = _paddr(addr)
 	
-	return "0x{addr:0{width}x}".format(addr=addr, width=16 if LP64 else 8)
+	return _ADDRESS_FORMAT.format(addr)
 
-def _encoding_type_to_cffi(tp):
-	"""Convert the given type object from objc.encoding into a CFFI type."""
+def _pointer_type_to_cffi(tp):
+	return ffi.typeof(ffi.getctype(_encoding_type_to_cffi(tp.element_type), "*"))
+
+def _array_type_to_cffi(tp):
+	return ffi.typeof(ffi.getctype(_encoding_type_to_cffi(tp.element_type), "[{}]".format(tp.length)))
+
+# Rendered struct/union field declarations, keyed by (field type, field name). The same field types (e. g. CGPoint inside CGRect) appear in many different structs.
+_field_decl_cache = {}
+
+def _aggregate_type_to_cffi(tp):
+	kw = "struct" if isinstance(tp, encoding.Struct) else "union"
 	
-	if not isinstance(tp, encoding.BaseType):
-		raise TypeError("tp must be an instance of a objc.encoding.BaseType subclass")
-	
-	if isinstance(tp, encoding.InternalType):
-		raise TypeError("Internal types (e. g. fields and bit fields) cannot be converted to CFFI types directly")
-	
-	if isinstance(tp, encoding.QualifiedType):
-		return _encoding_type_to_cffi(tp.type)
-	elif isinstance(tp, encoding.UnknownType):
-		return ffi.typeof("unknown_type")
-	elif isinstance(tp, encoding.Void):
-		return ffi.typeof("void")
-	elif isinstance(tp, encoding.Scalar):
-		return ffi.typeof(tp.type)
-	elif isinstance(tp, encoding.Pointer):
-		return ffi.typeof(ffi.getctype(_encoding_type_to_cffi(tp.element_type), "*"))
-	elif isinstance(tp, encoding.ID):
-		return ffi.typeof("id")
-	elif isinstance(tp, encoding.Class):
-		return ffi.typeof("Class")
-	elif isinstance(tp, encoding.Selector):
-		return ffi.typeof("SEL")
-	elif isinstance(tp, encoding.Array):
-		return ffi.typeof(ffi.getctype(_encoding_type_to_cffi(tp.element_type), "[{}]".format(tp.length)))
-	elif isinstance(tp, (encoding.Struct, encoding.Union)):
-		kw = "struct" if isinstance(tp, encoding.Struct) else "union"
-		
-		if tp.name is None and tp.fields is None:
-			return ffi.typeof("unknown_{}".format(kw))
-		
-		name = "" if tp.name is None else tp.name
-		
-		if tp.fields is None:
-			decl = "{kw} {name}".format(kw=kw, name=name)
-		else:
-			fields = []
-			for i, field in enumerate(tp.fields):
-				field_name = "_field_{}".format(i) if field.name is None else field.name
+	if tp.name is None and tp.fields is None:
+		return _TP_UNKNOWN_STRUCT if isinstance(tp, encoding.Struct) else _TP_UNKNOWN_UNION
+	
+	name = "" if tp.name is None else tp.name
+	
+	if tp.fields is None:
+		decl = "{kw} {name}".format(kw=kw, name=name)
+	else:
+		fields = []
+		for i, field in enumerate(tp.fields):
+			field_name = "_field_{}".format(i) if field.name is None else field.name
+			key = (field.type, field_name)
+			try:
+				field_decl = _field_decl_cache[key]
+			except KeyError:
 				if isinstance(field.type, encoding.BitField):
 					if field.type.width == 1:
 						field_decl = "bool {} : 1;".format(field_name)
@@ -526,14 +615,57 @@ def _encoding_type_to_cffi(tp):
 						field_decl = "unsigned int {} : {};".format(field_name, field.type.width)
 				else:
 					field_decl = ffi.getctype(_encoding_type_to_cffi(field.type), field_name) + ";"
-				fields.append(field_decl)
-			
-			if not fields:
-				fields.append("char _empty[0];")
-			
-			decl = "{kw} {name} {{{fields}}}".format(kw=kw, name=name, fields="".join(fields))
+				_field_decl_cache[key] = field_decl
+			fields.append(field_decl)
+		
+		if not fields:
+			fields.append("char _empty[0];")
+		
+		decl = "{kw} {name} {{{fields}}}".format(kw=kw, name=name, fields="".join(fields))
+	
+	return ffi.typeof(decl)
+
+# Maps each objc.encoding type class to a function converting instances of it to a CFFI type.
+# A single dict lookup on the exact type replaces a chain of isinstance checks.
+_ENCODING_TYPE_CONVERTERS = {
+	encoding.QualifiedType: lambda tp: _encoding_type_to_cffi(tp.type),
+	encoding.UnknownType: lambda tp: _TP_UNKNOWN_TYPE,
+	encoding.Void: lambda tp: void,
+	encoding.Scalar: lambda tp: ffi.typeof(tp.type),
+	encoding.Pointer: _pointer_type_to_cffi,
+	encoding.ID: lambda tp: _TP_ID,
+	encoding.Class: lambda tp: _TP_CLASS,
+	encoding.Selector: lambda tp: _TP_SEL,
+	encoding.Array: _array_type_to_cffi,
+	encoding.Struct: _aggregate_type_to_cffi,
+	encoding.Union: _aggregate_type_to_cffi,
+}
+
+@functools.lru_cache(maxsize=None)
+def _encoding_type_to_cffi(tp):
+	"""Convert the given type object from objc.encoding into a CFFI type."""
+	
+	try:
+		converter = _ENCODING_TYPE_CONVERTERS[type(tp)]
+	except KeyError:
+		if not isinstance(tp, encoding.BaseType):
+			raise TypeError("tp must be an instance of a objc.encoding.BaseType subclass")
+		
+		if isinstance(tp, encoding.InternalType):
+			raise TypeError("Internal types (e. g. fields and bit fields) cannot be converted to CFFI types directly")
 		
-		return ffi.typeof(decl)
+		# Subclass of one of the known types.
+		for base in type(tp).__mro__:
+			try:
+				converter = _ENCODING_TYPE_CONVERTERS[base]
+			except KeyError:
+				pass
+			else:
+				break
+		else:
+			raise TypeError("Don't know how to convert a {tp.__module__}.{tp.__qualname__} to a CFFI type".format(tp=type(tp)))
+	
+	return converter(tp)
 
 def _must_use_stret(restype):
 	"""Return whether the stret version of a polymorphic function (such as objc_msgSend) must be used for the given return type.
@@ -569,40 +701,65 @@ def _make_function_ptr_ctype(restype, argtypes):
 	return ffi.getctype(restype, "(*)({})".format(",".join(argdecls)))
 
 def _check_argcounts(op, args, argtypes):
-	"""Perform sanity checks to ensure that op, args and argtypes are somewhat valid and match each other."""
+	"""Perform sanity checks to ensure that op, args and argtypes are somewhat valid and match each other.
 	
-	if not libc.sel_isMapped(op):
-		raise ValueError("Invalid selector: {}".format(op))
+	Like assert statements, these checks are skipped when Python runs with optimizations enabled (-O).
+	"""
 	
-	if not (argtypes and argtypes[-1] is ...):
-		if len(args) != len(argtypes):
-			raise ValueError("Number of message arguments ({}) doesn't match number of argtypes ({})".format(len(args), len(argtypes)))
+	if __debug__:
+		if op not in _sel_colon_counts and not libc.sel_isMapped(op):
+			raise ValueError("Invalid selector: {}".format(op))
 		
-		sel_arg_count = ffi.string(libc.sel_getName(op)).count(b":")
-		if len(args) != sel_arg_count:
-			raise ValueError("Number of message arguments ({}) doesn't match number of colons in selector ({})".format(len(args), sel_arg_count))
+		if not (argtypes and argtypes[-1] is ...):
+			if len(args) != len(argtypes):
+				raise ValueError("Number of message arguments ({}) doesn't match number of argtypes ({})".format(len(args), len(argtypes)))
+			
+			sel_arg_count = _sel_colon_count(op)
+			if len(args) != sel_arg_count:
+				raise ValueError("Number of message arguments ({}) doesn't match number of colons in selector ({})".format(len(args), sel_arg_count))
+
+# The normal and stret versions of each polymorphic function, as a mapping of name to a tuple (normal, stret). The stret versions only exist (and are only needed) on 32-bit ARM.
+_POLYMORPHIC_SYMBOLS = {
+	name: (getattr(libc, name), None if LP64 else getattr(libc, name + "_stret"))
+	for name in ("objc_msgSend", "objc_msgSendSuper", "method_invoke")
+}
 
 def _get_polymorphic(name, restype, argtypes):
 	"""Get a function pointer for the polymorphic function with the given name, cast to the given restype and argtypes.
 	
 	If the restype requires use of a different function than normal (such as the _stret version for structures), the correct function is chosen automatically.
+	
+	The cast function pointers are cached per (name, restype, argtypes), so repeated calls with the same signature don't need to build a new function ctype.
 	"""
 	
-	return ffi.cast(_make_function_ptr_ctype(restype, argtypes), getattr(libc, name + "_stret" if _must_use_stret(restype) else name))
+	key = (name, restype, tuple(argtypes))
+	try:
+		return _polymorphic_cache[key]
+	except KeyError:
+		normal, stret = _POLYMORPHIC_SYMBOLS[name]
+		func = ffi.cast(_make_function_ptr_ctype(restype, argtypes), stret if _must_use_stret(restype) else normal)
+		_polymorphic_cache[key] = func
+		return func
+
+_polymorphic_cache = {}
 
-# Cache the objc_msgSend function cast to the signatures used for retain and release.
+# Fill the cache with the objc_msgSend signatures used for retain and release.
 # This is necessary because _gc_release needs to send a release message from within a Python __del__ method.
-# Normal _objc_msgSend uses ffi.typeof in multiple places, which internally acquires a (non-reentrant) lock.
+# Building a new function pointer uses ffi.getctype and ffi.cast, which internally acquire a (non-reentrant) lock.
 # Sometimes the __del__ method is called while the lock is already held, which leads to a deadlock.
-# By caching these function pointers beforehand, we don't need to use ffi.typeof later and can avoid the deadlock.
-_objc_msgSend_retain = _get_polymorphic("objc_msgSend", ffi.typeof("id"), (ffi.typeof("id"), ffi.typeof("SEL")))
-_objc_msgSend_release = _get_polymorphic("objc_msgSend", ffi.typeof("void"), (ffi.typeof("id"), ffi.typeof("SEL")))
+# By caching these function pointers beforehand, _retain and _release only need a dict lookup later and avoid the deadlock.
+_get_polymorphic("objc_msgSend", _TP_ID, (_TP_ID, _TP_SEL))
+_get_polymorphic("objc_msgSend", void, (_TP_ID, _TP_SEL))
 
 def _objc_msgSend(obj, op, *args, restype, argtypes):
 	"""Send a message to self with selector op, arguments args, return type restype and argument types argtypes."""
 	
 	_check_argcounts(op, args, argtypes)
-	return _get_polymorphic("objc_msgSend", restype, ("id", "SEL", *argtypes))(obj, op, *args)
+	return _get_polymorphic("objc_msgSend", restype, (_TP_ID, _TP_SEL, *argtypes))(obj, op, *args)
+
+_NO_RETAIN_PREFIXES = (b"copy", b"init", b"mutableCopy", b"new")
+# Results of _should_retain_result, keyed by SEL address. Selectors are unique and never unregistered, so these can be cached forever.
+_should_retain_cache = {}
 
 def _should_retain_result(sel):
 	"""Return whether the object result of the given method should be retained.
@@ -610,32 +767,53 @@ def _should_retain_result(sel):
 	According to Objective-C conventions, this is true unless the selector name starts with "copy", "init", "mutableCopy", or "new".
 	"""
 	
-	name = Selector(sel).name_bytes
-	return not (
-		name.startswith(b"copy")
-		or name.startswith(b"init")
-		or name.startswith(b"mutableCopy")
-		or name.startswith(b"new")
-	)
+	sel = Selector(sel)
+	key = sel._ptr_int
+	try:
+		return _should_retain_cache[key]
+	except KeyError:
+		result = _should_retain_cache[key] = not sel.name_bytes.startswith(_NO_RETAIN_PREFIXES)
+		return result
 
-_class_cdata = {
-	"NSArray": libc.objc_getClass(b"NSArray"),
-	"NSData": libc.objc_getClass(b"NSData"),
-	"NSDictionary": libc.objc_getClass(b"NSData"),
-	"NSSet": libc.objc_getClass(b"NSSet"),
-	"NSString": libc.objc_getClass(b"NSString"),
-	"NSValue": libc.objc_getClass(b"NSValue"),
-	"Protocol": libc.objc_getClass(b"Protocol"),
-}
+# Class cdata of classes that are used internally, looked up on first use by _class.
+_class_cdata = {}
+
+def _class(name):
+	"""Return the Class cdata for the given class name (a str), looking it up only the first time."""
+	
+	try:
+		return _class_cdata[name]
+	except KeyError:
+		cdata = libc.objc_getClass(name.encode("utf-8"))
+		if cdata == ffi.NULL:
+			raise ValueError("No class named {}".format(name))
+		_class_cdata[name] = cdata
+		return cdata
+
+# Results of _objc_issubclass and _is_protocol. The superclass chain of a registered class never changes, so these can be cached forever.
+_issubclass_cache = {}
+_is_protocol_cache = {}
 
 def _objc_issubclass(subclass, superclass):
-	while subclass != ffi.NULL:
-		if subclass == superclass:
-			return True
-		
-		cls = libc.class_getSuperclass(subclass)
+	"""Return whether the given Class (or id pointing to a class) cdata subclass is superclass or a (direct or indirect) subclass of it.
 	
-	return False
+	This is a primitive internal check that traverses the superclass chain.
+	"""
+	
+	key = subclass_addr, superclass_addr = _paddr(subclass), _paddr(superclass)
+	try:
+		return _issubclass_cache[key]
+	except KeyError:
+		result = False
+		while subclass_addr:
+			if subclass_addr == superclass_addr:
+				result = True
+				break
+			
+			subclass_addr = _paddr(libc.class_getSuperclass(ffi.cast(_TP_CLASS, subclass_addr)))
+		
+		_issubclass_cache[key] = result
+		return result
 
 def _is_protocol(ptr):
 	"""Return whether the given id cdata is an instance of Protocol.
@@ -643,15 +821,33 @@ def _is_protocol(ptr):
 	This is a primitive internal check that traverses the superclass chain and should only be used when normal isinstance checks are not an option (mainly in ID.__new__ to determine which class to instantiate).
 	"""
 	
-	cls = libc.object_getClass(ptr)
-	
-	while cls != ffi.NULL:
-		if cls == _class_cdata["Protocol"]:
-			return True
-		
-		cls = libc.class_getSuperclass(cls)
-	
-	return False
+	key = cls_addr = _paddr(libc.object_getClass(ptr))
+	try:
+		return _is_protocol_cache[key]
+	except KeyError:
+		result = False
+		protocol_addr = _paddr(_class("Protocol"))
+		while cls_addr:
+			if cls_addr == protocol_addr:
+				result = True
+				break
+			
+			cls_addr = _paddr(libc.class_getSuperclass(ffi.cast(_TP_CLASS, cls_addr)))
+		
+		_is_protocol_cache[key] = result
+		return result
+
+# Maps each ctype to a function (taking the cdata and the retain flag) that converts cdata of that type in unwrap_cdata.
+_CDATA_CONVERTERS = {
+	_TP_ID: lambda cdata, retain: ID(cdata, retain=retain), # Protocol * is the same ctype as id
+	_TP_CLASS: lambda cdata, retain: ID(cdata, retain=retain),
+	_TP_FLOAT: lambda cdata, retain: float(cdata),
+	_TP_DOUBLE: lambda cdata, retain: float(cdata),
+	_TP_CHAR: lambda cdata, retain: ffi.string(cdata),
+	_TP_BOOL: lambda cdata, retain: bool(cdata),
+	_TP_SEL: lambda cdata, retain: Selector(cdata),
+}
+_CDATA_CONVERTERS.update((tp, lambda cdata, retain: int(cdata)) for tp in INTEGER_TYPES)
 
 def unwrap_cdata(cdata, *, retain=True):
 	"""Convert the given cdata object to a more usable object.
@@ -667,73 +863,95 @@ def unwrap_cdata(cdata, *, retain=True):
 	Anything else is returned as is.
 	"""
 	
-	if isinstance(cdata, (ffi.typeof("id"), ffi.typeof("Class"), ffi.typeof("Protocol *"))):
-		return ID(cdata, retain=retain)
-	elif isinstance(cdata, INTEGER_TYPES):
-		return int(cdata)
-	elif isinstance(cdata, (ffi.typeof("float"), ffi.typeof("double"))):
-		return float(cdata)
-	elif isinstance(cdata, ffi.typeof("char")):
-		return ffi.string(cdata)
-	elif isinstance(cdata, ffi.typeof("bool")):
-		return bool(cdata)
-	elif isinstance(cdata, ffi.typeof("SEL")):
-		return Selector(cdata)
-	else:
-		return cdata
+	try:
+		converter = _CDATA_CONVERTERS[type(cdata)]
+	except KeyError:
+		for base in type(cdata).__mro__[1:]:
+			try:
+				converter = _CDATA_CONVERTERS[base]
+			except KeyError:
+				pass
+			else:
+				break
+		else:
+			return cdata
+	
+	return converter(cdata, retain)
 
 def to_string(s, cls=None):
 	if cls is None:
-		cls = classes.NSString
+		cls = Class("NSString")
 	
 	return cls.stringWithUTF8String_(s.encode("utf-8"))
 
 def to_data(b, cls=None):
 	if cls is None:
-		cls = classes.NSData
+		cls = Class("NSData")
 	
 	return cls.dataWithBytes_length_(b, len(b))
 
 def to_array(seq, cls=None):
 	if cls is None:
-		cls = classes.NSArray
+		cls = Class("NSArray")
 	
-	seq = [coerce(x).cdata for x in seq]
+	seq = list(seq)
+	buf = ffi.new("id []", len(seq))
+	for i, x in enumerate(seq):
+		buf[i] = coerce(x).cdata
 	
-	return cls.arrayWithObjects_count_(ffi.new("id []", seq), len(seq))
+	return cls.arrayWithObjects_count_(buf, len(seq))
 
 def to_set(seq, cls=None):
 	if cls is None:
-		cls = classes.NSSet
+		cls = Class("NSSet")
 	
-	seq = [coerce(x).cdata for x in seq]
+	seq = list(seq)
+	buf = ffi.new("id []", len(seq))
+	for i, x in enumerate(seq):
+		buf[i] = coerce(x).cdata
 	
-	return cls.setWithObjects_count_(ffi.new("id []", seq), len(seq))
+	return cls.setWithObjects_count_(buf, len(seq))
 
 def to_dictionary(mapping, cls=None):
 	if cls is None:
-		cls = classes.NSDictionary
+		cls = Class("NSDictionary")
 	
 	try:
 		mapping = mapping.items()
 	except AttributeError:
 		pass
 	
-	keys = []
-	values = []
-	
-	for k, v in mapping:
-		keys.append(coerce(k).cdata)
-		values.append(coerce(v).cdata)
-	
-	return cls.dictionaryWithObjects_forKeys_count_(ffi.new("id []", values), ffi.new("id []", keys), len(keys))
+	mapping = list(mapping)
+	keys = ffi.new("id []", len(mapping))
+	values = ffi.new("id []", len(mapping))
+	for i, (k, v) in enumerate(mapping):
+		keys[i] = coerce(k).cdata
+		values[i] = coerce(v).cdata
+	
+	return cls.dictionaryWithObjects_forKeys_count_(values, keys, len(mapping))
+
+# Converters for the most common Python types, looked up by exact type before the slower isinstance checks in coerce.
+_COERCE_FAST = {
+	str: to_string,
+	bytes: to_data,
+	dict: to_dictionary,
+	list: to_array,
+	tuple: to_array,
+	set: to_set,
+	frozenset: to_set,
+}
 
 def coerce(obj, cls=None):
+	if cls is None:
+		convert = _COERCE_FAST.get(type(obj))
+		if convert is not None:
+			return convert(obj)
+	
 	if isinstance(obj, ID):
 		if cls is not None and not _objc_issubclass(obj.cls.cdata, cls.cdata):
 			raise TypeError("{obj.cls.name} is not a subclass of {cls.name}".format(obj=obj, cls=cls))
 		return obj
-	elif cls is None or cls == obj.classes.NSObject:
+	elif cls is None or cls._ptr_int == _paddr(_class("NSObject")):
 		if isinstance(obj, str):
 			return to_string(obj)
 		elif isinstance(obj, bytes):
@@ -746,19 +964,89 @@ def coerce(obj, cls=None):
 			return to_array(obj)
 		else:
 			raise TypeError("Don't know how to convert a {tp.__module__}.{tp.__qualname__} to an Objective-C object".format(tp=type(obj)))
-	elif _objc_issubclass(cls.cdata, _class_cdata["NSString"]):
+	elif _objc_issubclass(cls.cdata, _class("NSString")):
 		return to_string(obj, cls)
-	elif _objc_issubclass(cls.cdata, _class_cdata["NSData"]):
+	elif _objc_issubclass(cls.cdata, _class("NSData")):
 		return to_data(obj, cls)
-	elif _objc_issubclass(cls.cdata, _class_cdata["NSArray"]):
+	elif _objc_issubclass(cls.cdata, _class("NSArray")):
 		return to_array(obj, cls)
-	elif _objc_issubclass(cls.cdata, _class_cdata["NSDictionary"]):
-		return to_string(obj, cls)
-	elif _objc_issubclass(cls.cdata, _class_cdata["NSSet"]):
+	elif _objc_issubclass(cls.cdata, _class("NSDictionary")):
+		return to_dictionary(obj, cls)
+	elif _objc_issubclass(cls.cdata, _class("NSSet")):
 		return to_set(obj, cls)
 	else:
 		raise ValueError("Don't know how to convert to an Objective-C {cls.name}".format(cls=cls))
 
+# Types that coerce can never convert, and which are passed to id-typed arguments unchanged. Checking for these first avoids raising and catching a TypeError in coerce.
+_TRIVIAL_TYPES = (int, float, type(None))
+
+def _coerce_class_arg(arg):
+	if isinstance(arg, Class):
+		return ffi.cast(_TP_CLASS, arg.cdata)
+	elif isinstance(arg, (ID, Selector)):
+		return arg.cdata
+	else:
+		return arg
+
+def _coerce_id_arg(arg):
+	if isinstance(arg, (ID, Selector)):
+		return arg.cdata
+	elif type(arg) in _TRIVIAL_TYPES:
+		return arg
+	
+	try:
+		return coerce(arg).cdata
+	except TypeError:
+		return arg
+
+def _coerce_other_arg(arg):
+	if isinstance(arg, (ID, Selector)):
+		return arg.cdata
+	else:
+		return arg
+
+# The argument coercion function for each argtype, as chosen by _arg_coercer.
+_arg_coercers = {}
+
+def _arg_coercer(tp):
+	"""Return the function that converts a Python argument for a message send with the given argtype to a value that can be passed to CFFI."""
+	
+	try:
+		return _arg_coercers[tp]
+	except KeyError:
+		if isinstance(tp, type) and issubclass(tp, _TP_CLASS):
+			coercer = _coerce_class_arg
+		elif isinstance(tp, type) and issubclass(tp, _TP_ID):
+			coercer = _coerce_id_arg
+		else:
+			coercer = _coerce_other_arg
+		
+		_arg_coercers[tp] = coercer
+		return coercer
+
+# Names of all attributes defined by each class and its superclasses, as computed by _type_attribute_names.
+_type_attribute_names_cache = {}
+
+def _type_attribute_names(tp):
+	"""Return a frozenset of the names of all attributes (including slots) defined by the given Python class and its superclasses."""
+	
+	try:
+		return _type_attribute_names_cache[tp]
+	except KeyError:
+		names = _type_attribute_names_cache[tp] = frozenset(name for klass in tp.__mro__ for name in vars(klass))
+		return names
+
+def _instance_dict(obj):
+	"""Return the instance __dict__ of the given object, or an empty dict if it has none (because its class uses __slots__)."""
+	
+	try:
+		return object.__getattribute__(obj, "__dict__")
+	except AttributeError:
+		return {}
+
+# Plain dicts preserve insertion order since Python 3.7, and are faster and smaller than OrderedDict. On older versions (this library supports 3.5) OrderedDict is still needed.
+_OrderedDict = dict if sys.version_info >= (3, 7) else collections.OrderedDict
+
 class LazyMapping(collections.abc.Mapping):
 	__slots__ = ()
 	
@@ -766,7 +1054,9 @@ class LazyMapping(collections.abc.Mapping):
 		return "<lazy mapping {cls.__module__}.{cls.__qualname__} at {addr:#x} (use list(mapping.keys()) or list(mapping.items()) to see contents)>".format(cls=type(self), addr=id(self))
 
 class MappingChain(LazyMapping):
-	__slots__ = ("_mappings",)
+	"""A read-only mapping combining several other mappings. If a key is present in more than one of them, the value from the mapping passed last takes priority."""
+	
+	__slots__ = ("_flat", "_mappings")
 	
 	def __init__(self, *mappings):
 		super().__init__()
@@ -777,15 +1067,44 @@ class MappingChain(LazyMapping):
 			else:
 				self._mappings.append(mapping)
 		self._mappings.reverse()
+		self._flat = None
 	
-	def __contains__(self, key):
-		for mapping in self._mappings:
-			if key in mapping:
-				return True
+	def _get_flat(self):
+		"""Return a single dict containing the combined items of all mappings, with the correct priority. It is built (and all mappings are fully loaded) on first use."""
 		
-		return False
+		flat = self._flat
+		if flat is None:
+			flat = {}
+			for mapping in self._mappings:
+				for key, value in mapping.items():
+					flat.setdefault(key, value)
+			self._flat = flat
+		return flat
+	
+	def __contains__(self, key):
+		# Accept the same key forms as __getitem__, not just the ones stored in the flat dict.
+		try:
+			self[key]
+		except KeyError:
+			return False
+		else:
+			return True
 	
 	def __getitem__(self, key):
+		flat = self._get_flat()
+		try:
+			return flat[key]
+		except KeyError:
+			pass
+		
+		# Mappings keyed by name bytes (such as the declared property mappings) also accept str names, so try the encoded name in the flat dict before asking every mapping.
+		if isinstance(key, str):
+			try:
+				return flat[key.encode("utf-8")]
+			except KeyError:
+				pass
+		
+		# The mappings may accept keys in other forms than the ones they list (e. g. str instead of bytes), so ask them as well.
 		for mapping in self._mappings:
 			try:
 				return mapping[key]
@@ -795,34 +1114,43 @@ class MappingChain(LazyMapping):
 		raise KeyError(key)
 	
 	def __iter__(self):
-		seen = set()
-		for mapping in self._mappings:
-			for key in mapping:
-				if key not in seen:
-					seen.add(key)
-					yield key
+		return iter(self._get_flat())
 	
 	def __len__(self):
-		return sum(len(mapping) for mapping in self._mappings)
+		return len(self._get_flat())
 
 class LazyOrderedDict(LazyMapping):
-	__slots__ = ("_cached",)
+	__slots__ = ("_cached", "_fill_lock")
+	
+	def __init__(self):
+		super().__init__()
+		self._cached = None
+		# Each mapping has its own lock, so filling one mapping (which may send arbitrary messages) never blocks or is blocked by the filling of unrelated mappings.
+		self._fill_lock = threading.Lock()
 	
 	def _get_full(self):
 		raise NotImplementedError()
 	
 	def _get_cached(self):
-		try:
-			return self._cached
-		except AttributeError:
-			self._cached = self._get_full()
-			return self._cached
+		cached = self._cached
+		if cached is not None:
+			return cached
+		
+		with self._fill_lock:
+			cached = self._cached
+			if cached is None:
+				cached = self._cached = self._get_full()
+			return cached
 	
 	def __contains__(self, value):
 		return value in self._get_cached()
 	
 	def __getitem__(self, key):
-		return self._get_cached()[key]
+		# This is the hot path for method lookups, so avoid the extra call once the mapping is filled.
+		cached = self._cached
+		if cached is None:
+			cached = self._get_cached()
+		return cached[key]
 	
 	def __iter__(self):
 		return iter(self._get_cached())
@@ -845,6 +1173,7 @@ class LazyOrderedDict(LazyMapping):
 	def __ne__(self, other):
 		return self._get_cached() != other
 
+@functools.total_ordering
 class Selector(object):
 	"""Represents an Objective-C selector (SEL)."""
 	
@@ -854,22 +1183,32 @@ class Selector(object):
 		int,
 	)
 	
-	__slots__ = ("__weakref__", "cdata")
+	__slots__ = ("__weakref__", "_name_bytes_cached", "_name_cached", "_ptr_int", "cdata")
 	
-	_cache = weakref.WeakValueDictionary()
-	_cache_lock = threading.RLock()
+	# Maps addresses to weak references to the instances wrapping them.
+	_cache = {}
+	# Maps selector names (str and bytes) to their instances. Registered selectors are never removed from the runtime, so these are kept alive forever.
+	_name_cache = {}
 	
 	@property
 	def name_bytes(self):
 		"""The selector's name as bytes."""
 		
-		return ffi.string(libc.sel_getName(self.cdata))
+		try:
+			return self._name_bytes_cached
+		except AttributeError:
+			self._name_bytes_cached = ffi.string(libc.sel_getName(self.cdata))
+			return self._name_bytes_cached
 	
 	@property
 	def name(self):
 		"""The selector's name."""
 		
-		return self.name_bytes.decode("utf-8")
+		try:
+			return self._name_cached
+		except AttributeError:
+			self._name_cached = self.name_bytes.decode("utf-8")
+			return self._name_cached
 	
 	def __new__(cls, arg):
 		"""Create a selector from arg.
@@ -879,40 +1218,48 @@ class Selector(object):
 		If arg is a SEL or void * cdata or an int, wrap the SEL at that address. (Selector instances are cached, only one object exists per address.) If the address is NULL, return None. sel_isMapped is used to check whether the address points to a valid SEL, and if not, raise a ValueError.
 		"""
 		
+		if type(arg) in (str, bytes):
+			try:
+				return cls._name_cache[arg]
+			except KeyError:
+				pass
+		
 		if isinstance(arg, cls):
 			return arg
 		elif isinstance(arg, str):
-			return cls(arg.encode("utf-8"))
+			self = cls._name_cache[arg] = cls(arg.encode("utf-8"))
+			return self
 		elif isinstance(arg, bytes):
-			return cls(libc.sel_registerName(arg))
+			self = cls._name_cache[arg] = cls(_sel_register(arg))
+			return self
 		elif isinstance(arg, Selector._CTYPES):
-			arg = ffi.cast("SEL", arg)
+			# Values returned by the runtime already have the right type and don't need to be cast again.
+			if type(arg) is not _TP_SEL:
+				arg = ffi.cast(_TP_SEL, arg)
 			
-			if arg == ffi.NULL:
+			if not arg:
 				return None
 			else:
-				try:
-					return cls._cache[arg]
-				except KeyError:
-					with cls._cache_lock:
-						try:
-							return cls._cache[arg]
-						except KeyError:
-							if not libc.sel_isMapped(arg):
-								raise ValueError("Not a valid selector: {}".format(arg))
-							
-							self = super().__new__(cls)
-							self.cdata = arg
-							cls._cache[arg] = self
-							return self
+				key = _paddr(arg)
+				self = _weak_cache_get(cls._cache, key)
+				if self is None:
+					if not libc.sel_isMapped(arg):
+						raise ValueError("Not a valid selector: {}".format(arg))
+					
+					self = super().__new__(cls)
+					self.cdata = arg
+					self._ptr_int = key
+					# If another thread wrapped the same SEL in the meantime, use its instance.
+					self = _weak_cache_setdefault(cls._cache, key, self)
+				return self
 		else:
-			raise TypeError("Expected a selector name as a string or bytes, an instance of {cls.__module__}.{cls.__qualname__}, or a SEL-like cdata, not {tp.__module__}.{tp.__qualname__}".format(cls=cls, tp=type(arg)))
+			_raise_type_error(cls, arg, "a selector name as a string or bytes, an instance of {cls.__module__}.{cls.__qualname__}, or a SEL-like cdata")
 	
 	def __eq__(self, other):
-		return isinstance(other, Selector) and self.cdata == other.cdata
+		return isinstance(other, Selector) and self._ptr_int == other._ptr_int
 	
-	def __ne__(self, other):
-		return not isinstance(other, Selector) or self.cdata != other.cdata
+	def __hash__(self):
+		return self._ptr_int
 	
 	def __lt__(self, other):
 		if isinstance(other, Selector):
@@ -920,26 +1267,6 @@ class Selector(object):
 		else:
 			return NotImplemented
 	
-	def __le__(self, other):
-		if isinstance(other, Selector):
-			return self.name_bytes <= other.name_bytes
-		else:
-			return NotImplemented
-	
-	def __ge__(self, other):
-		if isinstance(other, Selector):
-			return self.name_bytes >= other.name_bytes
-		else:
-			return NotImplemented
-	
-	def __gt__(self, other):
-		if isinstance(other, Selector):
-			return self.name_bytes > other.name_bytes
-		else:
-			return NotImplemented
-	
-	def __hash__(self):
-		return hash(self.cdata)
 	
 	def __bytes__(self):
 		return self.name_bytes
@@ -954,6 +1281,17 @@ class Selector(object):
 			name = self.name_bytes
 		return "{cls.__module__}.{cls.__qualname__}({name!r})".format(cls=type(self), self=self, name=name)
 
+# Selectors used internally for type and responds-to checks.
+_SEL_RESPONDS_TO_SELECTOR = Selector(b"respondsToSelector:")
+_SEL_INSTANCES_RESPOND_TO_SELECTOR = Selector(b"instancesRespondToSelector:")
+_SEL_IS_SUBCLASS_OF_CLASS = Selector(b"isSubclassOfClass:")
+_SEL_IS_KIND_OF_CLASS = Selector(b"isKindOfClass:")
+_SEL_CONFORMS_TO_PROTOCOL = Selector(b"conformsToProtocol:")
+
+# SEL cdata used by _retain and _release, which send these messages directly.
+_SEL_RETAIN = Selector(b"retain").cdata
+_SEL_RELEASE = Selector(b"release").cdata
+
 class Ivar(object):
 	"""Represents an Objective-C ivar."""
 	
@@ -963,22 +1301,29 @@ class Ivar(object):
 		int,
 	)
 	
-	__slots__ = ("__weakref__", "_type_cached", "cdata")
+	__slots__ = ("__weakref__", "_name_bytes_cached", "_name_cached", "_ptr_int", "_type_cached", "_type_encoding_bytes_cached", "cdata")
 	
-	_cache = weakref.WeakValueDictionary()
-	_cache_lock = threading.RLock()
+	_cache = {}
 	
 	@property
 	def name_bytes(self):
 		"""The ivar's name as bytes."""
 		
-		return ffi.string(libc.ivar_getName(self.cdata))
+		try:
+			return self._name_bytes_cached
+		except AttributeError:
+			self._name_bytes_cached = ffi.string(libc.ivar_getName(self.cdata))
+			return self._name_bytes_cached
 	
 	@property
 	def name(self):
 		"""The ivar's name."""
 		
-		return self.name_bytes.decode("utf-8")
+		try:
+			return self._name_cached
+		except AttributeError:
+			self._name_cached = self.name_bytes.decode("utf-8")
+			return self._name_cached
 	
 	@property
 	def offset(self):
@@ -990,7 +1335,11 @@ class Ivar(object):
 	def type_encoding_bytes(self):
 		"""The ivar's type encoding as bytes."""
 		
-		return ffi.string(libc.ivar_getTypeEncoding(self.cdata))
+		try:
+			return self._type_encoding_bytes_cached
+		except AttributeError:
+			self._type_encoding_bytes_cached = ffi.string(libc.ivar_getTypeEncoding(self.cdata))
+			return self._type_encoding_bytes_cached
 	
 	@property
 	def type_encoding(self):
@@ -1018,30 +1367,32 @@ class Ivar(object):
 		if isinstance(arg, cls):
 			return arg
 		elif isinstance(arg, Ivar._CTYPES):
-			arg = ffi.cast("Ivar", arg)
+			if type(arg) is not _TP_IVAR:
+				arg = ffi.cast(_TP_IVAR, arg)
 			
-			if arg == ffi.NULL:
+			if not arg:
 				return None
 			else:
-				try:
-					return cls._cache[arg]
-				except KeyError:
-					with cls._cache_lock:
-						try:
-							return cls._cache[arg]
-						except KeyError:
-							self = super().__new__(cls)
-							self.cdata = arg
-							cls._cache[arg] = self
-							return self
+				key = _paddr(arg)
+				self = _weak_cache_get(cls._cache, key)
+				if self is None:
+					self = super().__new__(cls)
+					self.cdata = arg
+					self._ptr_int = key
+					# If another thread wrapped the same address in the meantime, use its instance.
+					self = _weak_cache_setdefault(cls._cache, key, self)
+				return self
 		else:
-			raise TypeError("Expected an instance of {cls.__module__}.{cls.__qualname__}, or an Ivar-like cdata, not {tp.__module__}.{tp.__qualname__}".format(cls=cls, tp=type(arg)))
+			_raise_type_error(cls, arg, "an instance of {cls.__module__}.{cls.__qualname__}, or an Ivar-like cdata")
 	
 	def __eq__(self, other):
-		return isinstance(other, Ivar) and self.cdata == other.cdata
+		return isinstance(other, Ivar) and self._ptr_int == other._ptr_int
 	
 	def __ne__(self, other):
-		return not isinstance(other, Ivar) or self.cdata != other.cdata
+		return not isinstance(other, Ivar) or self._ptr_int != other._ptr_int
+	
+	def __hash__(self):
+		return self._ptr_int
 	
 	def __repr__(self):
 		try:
@@ -1053,7 +1404,7 @@ class Ivar(object):
 	def _get_pointer(self, base):
 		"""Create a pointer to this ivar's data in the object pointed to by base."""
 		
-		return ffi.cast(ffi.getctype(self.type, "*"), ffi.cast("char *", base) + self.offset)
+		return ffi.cast(ffi.getctype(self.type, "*"), ffi.cast(_TP_CHAR_P, base) + self.offset)
 	
 	def get(self, instance):
 		"""Get the value of this ivar in the given object. Only use when you're desperate, you should normally use public properties or methods to get an object's data."""
@@ -1077,10 +1428,9 @@ class Method(object):
 		int,
 	)
 	
-	__slots__ = ("__weakref__", "cdata")
+	__slots__ = ("__weakref__", "_arg_coercers_cached", "_method_invoke_cached", "_ptr_int", "_selector_cached", "_signature_cached", "_type_encoding_bytes_cached", "cdata")
 	
-	_cache = weakref.WeakValueDictionary()
-	_cache_lock = threading.RLock()
+	_cache = {}
 	
 	@property
 	def argument_count(self):
@@ -1102,13 +1452,21 @@ class Method(object):
 	def selector(self):
 		"""The method's selector."""
 		
-		return Selector(libc.method_getName(self.cdata))
+		try:
+			return self._selector_cached
+		except AttributeError:
+			self._selector_cached = Selector(libc.method_getName(self.cdata))
+			return self._selector_cached
 	
 	@property
 	def type_encoding_bytes(self):
 		"""The method's type encoding as bytes."""
 		
-		return ffi.string(libc.method_getTypeEncoding(self.cdata))
+		try:
+			return self._type_encoding_bytes_cached
+		except AttributeError:
+			self._type_encoding_bytes_cached = ffi.string(libc.method_getTypeEncoding(self.cdata))
+			return self._type_encoding_bytes_cached
 	
 	@property
 	def type_encoding(self):
@@ -1126,30 +1484,32 @@ class Method(object):
 		if isinstance(arg, cls):
 			return arg
 		elif isinstance(arg, Method._CTYPES):
-			arg = ffi.cast("Method", arg)
+			if type(arg) is not _TP_METHOD:
+				arg = ffi.cast(_TP_METHOD, arg)
 			
-			if arg == ffi.NULL:
+			if not arg:
 				return None
 			else:
-				try:
-					return cls._cache[arg]
-				except KeyError:
-					with cls._cache_lock:
-						try:
-							return cls._cache[arg]
-						except KeyError:
-							self = super().__new__(cls)
-							self.cdata = arg
-							cls._cache[arg] = self
-							return self
+				key = _paddr(arg)
+				self = _weak_cache_get(cls._cache, key)
+				if self is None:
+					self = super().__new__(cls)
+					self.cdata = arg
+					self._ptr_int = key
+					# If another thread wrapped the same address in the meantime, use its instance.
+					self = _weak_cache_setdefault(cls._cache, key, self)
+				return self
 		else:
-			raise TypeError("Expected an instance of {cls.__module__}.{cls.__qualname__}, or a Method-like cdata, not {tp.__module__}.{tp.__qualname__}".format(cls=cls, tp=type(arg)))
+			_raise_type_error(cls, arg, "an instance of {cls.__module__}.{cls.__qualname__}, or a Method-like cdata")
 	
 	def __eq__(self, other):
-		return isinstance(other, Method) and self.cdata == other.cdata
+		return isinstance(other, Method) and self._ptr_int == other._ptr_int
 	
 	def __ne__(self, other):
-		return not isinstance(other, Method) or self.cdata != other.cdata
+		return not isinstance(other, Method) or self._ptr_int != other._ptr_int
+	
+	def __hash__(self):
+		return self._ptr_int
 	
 	def __repr__(self):
 		try:
@@ -1161,9 +1521,14 @@ class Method(object):
 	
 	def __call__(self, receiver, *args, restype=None, argtypes=None):
 		receiver = ID(receiver)
-		sel = Selector(sel)
+		sel = self.selector
 		if argtypes is None and restype is None:
-			restype, argtypes = self.decode_signature()
+			# The method's own signature never changes, so the function pointer for it only needs to be looked up once.
+			try:
+				func = self._method_invoke_cached
+			except AttributeError:
+				restype, argtypes = self._get_signature()
+				func = self._method_invoke_cached = _get_polymorphic("method_invoke", restype, (_TP_ID, _TP_METHOD, *argtypes))
 		elif argtypes is None or restype is None:
 			raise ValueError("restype and argtypes must be passed together")
 		else:
@@ -1171,9 +1536,10 @@ class Method(object):
 				restype = ffi.typeof(restype)
 			
 			argtypes = [ffi.typeof(at) if isinstance(at, str) else at for at in argtypes]
+			func = _get_polymorphic("method_invoke", restype, (_TP_ID, _TP_METHOD, *argtypes))
 		
 		return unwrap_cdata(
-			_get_polymorphic("method_invoke", restype, ("id", "Method", *argtypes))(receiver.cdata, self.cdata, *args),
+			func(receiver.cdata, self.cdata, *args),
 			retain=_should_retain_result(sel),
 		)
 	
@@ -1190,6 +1556,28 @@ class Method(object):
 		restype, argtypes = self.decode_signature_raw()
 		return _encoding_type_to_cffi(restype), [_encoding_type_to_cffi(argtype) for argtype in argtypes]
 	
+	def _get_signature(self):
+		"""Return the method's signature as a tuple (restype, argtypes) of CFFI types, with argtypes as a tuple.
+		
+		Unlike decode_signature, the result is cached, because a method's type encoding never changes.
+		"""
+		
+		try:
+			return self._signature_cached
+		except AttributeError:
+			restype, argtypes = self.decode_signature()
+			self._signature_cached = (restype, tuple(argtypes))
+			return self._signature_cached
+	
+	def _get_arg_coercers(self):
+		"""Return a tuple containing the argument coercion function for each of the method's argtypes (see _arg_coercer)."""
+		
+		try:
+			return self._arg_coercers_cached
+		except AttributeError:
+			self._arg_coercers_cached = tuple(_arg_coercer(tp) for tp in self._get_signature()[1])
+			return self._arg_coercers_cached
+	
 	def exchange_implementations(self, other):
 		"""Atomically exchange the implementation of this method with that of the given other method."""
 		
@@ -1201,7 +1589,7 @@ class Method(object):
 class BoundMethod(object):
 	"""A Method bound to an ID, which can be called directly."""
 	
-	__slots__ = ("__weakref__", "instance", "selector")
+	__slots__ = ("instance", "selector")
 	
 	@property
 	def method(self):
@@ -1258,28 +1646,39 @@ class Property(object):
 		int,
 	)
 	
-	__slots__ = ("__weakref__", "_attributes_cached", "_type_cached", "cdata")
+	__slots__ = ("__weakref__", "_attribute_encoding_bytes_cached", "_attributes_cached", "_name_bytes_cached", "_name_cached", "_ptr_int", "_type_cached", "cdata")
 	
-	_cache = weakref.WeakValueDictionary()
-	_cache_lock = threading.RLock()
+	_cache = {}
 	
 	@property
 	def name_bytes(self):
 		"""The property's name as bytes."""
 		
-		return ffi.string(libc.property_getName(self.cdata))
+		try:
+			return self._name_bytes_cached
+		except AttributeError:
+			self._name_bytes_cached = ffi.string(libc.property_getName(self.cdata))
+			return self._name_bytes_cached
 	
 	@property
 	def name(self):
 		"""The property's name."""
 		
-		return self.name_bytes.decode("utf-8")
+		try:
+			return self._name_cached
+		except AttributeError:
+			self._name_cached = self.name_bytes.decode("utf-8")
+			return self._name_cached
 	
 	@property
 	def attribute_encoding_bytes(self):
 		"""The property's attribute encoding as bytes."""
 		
-		return ffi.string(libc.property_getAttributes(self.cdata))
+		try:
+			return self._attribute_encoding_bytes_cached
+		except AttributeError:
+			self._attribute_encoding_bytes_cached = ffi.string(libc.property_getAttributes(self.cdata))
+			return self._attribute_encoding_bytes_cached
 	
 	@property
 	def attribute_encoding(self):
@@ -1319,7 +1718,7 @@ class Property(object):
 		
 		sel = self.attributes.getter
 		if sel is None:
-			sel = self.name
+			sel = self.name_bytes
 		return Selector(sel)
 	
 	@property
@@ -1344,30 +1743,32 @@ class Property(object):
 		if isinstance(arg, cls):
 			return arg
 		elif isinstance(arg, Property._CTYPES):
-			arg = ffi.cast("objc_property_t", arg)
+			if type(arg) is not _TP_PROPERTY:
+				arg = ffi.cast(_TP_PROPERTY, arg)
 			
-			if arg == ffi.NULL:
+			if not arg:
 				return None
 			else:
-				try:
-					return cls._cache[arg]
-				except KeyError:
-					with cls._cache_lock:
-						try:
-							return cls._cache[arg]
-						except KeyError:
-							self = super().__new__(cls)
-							self.cdata = arg
-							cls._cache[arg] = self
-							return self
+				key = _paddr(arg)
+				self = _weak_cache_get(cls._cache, key)
+				if self is None:
+					self = super().__new__(cls)
+					self.cdata = arg
+					self._ptr_int = key
+					# If another thread wrapped the same address in the meantime, use its instance.
+					self = _weak_cache_setdefault(cls._cache, key, self)
+				return self
 		else:
-			raise TypeError("Expected an instance of {cls.__module__}.{cls.__qualname__}, or an objc_property_t-like cdata, not {tp.__module__}.{tp.__qualname__}".format(cls=cls, tp=type(arg)))
+			_raise_type_error(cls, arg, "an instance of {cls.__module__}.{cls.__qualname__}, or an objc_property_t-like cdata")
 	
 	def __eq__(self, other):
-		return isinstance(other, Property) and self.cdata == other.cdata
+		return isinstance(other, Property) and self._ptr_int == other._ptr_int
 	
 	def __ne__(self, other):
-		return not isinstance(other, Property) or self.cdata != other.cdata
+		return not isinstance(other, Property) or self._ptr_int != other._ptr_int
+	
+	def __hash__(self):
+		return self._ptr_int
 	
 	def __repr__(self):
 		try:
@@ -1403,7 +1804,7 @@ class ID(object):
 			self._instance = instance
 		
 		def _get_full(self):
-			return collections.OrderedDict((sel, BoundMethod(self._instance, sel)) for sel in self._instance.cls.instance_methods.keys())
+			return _OrderedDict((sel, BoundMethod(self._instance, sel)) for sel in self._instance.cls.instance_methods.keys())
 		
 		def __getitem__(self, key):
 			self._instance.cls.instance_methods[key] # Cause a KeyError if the method is not valid
@@ -1417,7 +1818,7 @@ class ID(object):
 			self._instance = instance
 		
 		def _get_full(self):
-			return collections.OrderedDict((name, prop.get(self._instance)) for name, prop in self._instance.cls.instance_properties.items())
+			return _OrderedDict((name, prop.get(self._instance)) for name, prop in self._instance.cls.instance_properties.items())
 		
 		def __getitem__(self, key):
 			return self._instance.cls.instance_properties[key].get(self._instance)
@@ -1432,20 +1833,30 @@ class ID(object):
 		int,
 	)
 	
-	__slots__ = ("__weakref__", "_methods_cache", "cdata", "methods", "properties")
+	__slots__ = ("__weakref__", "_ptr_int", "cdata", "methods", "properties")
+	
+	# Attributes that every ID instance has. Objective-C properties with these names must never shadow them in __setattr__.
+	_INSTANCE_ATTRIBUTE_NAMES = frozenset(("_ptr_int", "cdata", "methods", "properties"))
 	
-	_cache = weakref.WeakValueDictionary()
-	_cache_lock = threading.RLock()
+	_cache = {}
 	
 	@property
 	def _objc_ptr(self):
-		return int(ffi.cast("uintptr_t", self.cdata))
+		return self._ptr_int
 	
 	@property
 	def cls(self):
 		"""The object's class."""
 		return Class(libc.object_getClass(self.cdata))
 	
+	def _init_wrapper(self):
+		"""Set up any additional attributes of a newly created wrapper. Subclasses override this to initialize their own slots.
+		
+		This is called by __new__ after cdata has been set, but before the wrapper is added to the cache.
+		"""
+		
+		pass
+	
 	def __new__(cls, arg, *, retain=True):
 		"""Create an ID from arg.
 		
@@ -1469,41 +1880,44 @@ class ID(object):
 			return arg
 		elif isinstance(arg, ID._CTYPES):
 			# Create an ID from a cdata.
-			arg = ffi.cast("id", arg)
+			arg = ffi.cast(_TP_ID, arg)
 			
 			if arg == ffi.NULL:
 				return None
 			
 			if not issubclass(cls, Class) and libc.object_isClass(arg):
 				# If arg points to a class, return a Class instead.
-				return Class(ffi.cast("Class", arg), retain=retain)
+				return Class(ffi.cast(_TP_CLASS, arg), retain=retain)
 			elif not issubclass(cls, Protocol) and _is_protocol(arg):
 				# If arg points to a Protocol, return a Protocol instead.
-				return Protocol(ffi.cast("Protocol *", arg), retain=retain)
+				return Protocol(ffi.cast(_TP_PROTO_P, arg), retain=retain)
 			else:
 				# See if we already have an instance cached, otherwise create one.
-				try:
-					self = cls._cache[arg]
+				key = _paddr(arg)
+				self = _weak_cache_get(cls._cache, key)
+				if self is not None:
 					if not retain:
 						_release(self.cdata)
 					return self
-				except KeyError:
-					with cls._cache_lock:
-						try:
-							self = cls._cache[arg]
-							if not retain:
-								_release(self.cdata)
-							return self
-						except KeyError:
-							self = super().__new__(cls)
-							object.__setattr__(self, "cdata", _gc_release(arg))
-							if retain:
-								_retain(arg)
-							cls._cache[arg] = self
-							object.__setattr__(self, "methods", ID._Methods(self))
-							object.__setattr__(self, "properties", ID._Properties(self) if SHORT_PROPERTIES else {})
-							object.__setattr__(self, "_methods_cache", weakref.WeakValueDictionary())
-							return self
+				else:
+					self = super().__new__(cls)
+					object.__setattr__(self, "cdata", arg)
+					object.__setattr__(self, "_ptr_int", key)
+					object.__setattr__(self, "methods", ID._Methods(self))
+					object.__setattr__(self, "properties", ID._Properties(self) if SHORT_PROPERTIES else {})
+					# The instance must be fully initialized before it is put in the cache, where other threads can see it.
+					self._init_wrapper()
+					
+					winner = _weak_cache_setdefault(cls._cache, key, self)
+					if winner is self:
+						# Only the instance that ends up in the cache takes ownership of the object.
+						object.__setattr__(self, "cdata", _gc_release(arg))
+						if retain:
+							_retain(arg)
+					elif not retain:
+						# Another thread wrapped the same object in the meantime, so behave as if it had been cached already.
+						_release(winner.cdata)
+					return winner
 		elif isinstance(arg, (objc_util.ObjCInstance, objc_util.ObjCClass)):
 			return ID(arg.ptr, retain=retain)
 		elif isinstance(arg, ctypes.c_void_p):
@@ -1512,7 +1926,7 @@ class ID(object):
 			try:
 				addr = arg._objc_ptr
 			except AttributeError:
-				raise TypeError("Expected an instance of objc.ID, objc_util.ObjCInstance, or objc_util.ObjCClass, an id-like cdata, or an object with _objc_ptr, not {tp.__module__}.{tp.__qualname__}".format(tp=type(arg)))
+				_raise_type_error(cls, arg, "an instance of objc.ID, objc_util.ObjCInstance, or objc_util.ObjCClass, an id-like cdata, or an object with _objc_ptr")
 			else:
 				return ID(addr, retain=retain)
 				
@@ -1533,21 +1947,14 @@ class ID(object):
 		except AttributeError:
 			super().__setattr__(name, value)
 		else:
-			if self.cls._instance_property_names is None:
-				# Lazy init of _instance_property_names. This can't be done in __new__, because at that point self.cls may not exist yet because of metaclasses and stuff.
-				self.cls._instance_property_names = {prop.name for prop in self.cls.instance_properties}
-			
-			try:
-				# Check if a real attribute with this name exists.
-				object.__getattribute__(self, name)
-			except AttributeError:
+			cls = self.cls
+			if name in _type_attribute_names(type(self)) or name in ID._INSTANCE_ATTRIBUTE_NAMES or name in _instance_dict(self):
+				# If a real attribute with this name exists, always use normal __setattr__, so our own attribute setting won't break because of a badly named Objective-C property.
+				super().__setattr__(name, value)
+			elif name in cls._get_instance_property_names():
 				# If not, try setting a property, and fall back to normal __setattr__ otherwise.
-				if name in self.cls._instance_property_names:
-					self.properties[name] = value
-				else:
-					super().__setattr__(name, value)
+				cls.instance_properties[name].set(self, value)
 			else:
-				# If a read attribute with this name does exist, always use normal __setattr__, so our own attribute setting won't break because of a badly named Objective-C property.
 				super().__setattr__(name, value)
 	
 	def __dir__(self):
@@ -1570,10 +1977,13 @@ class ID(object):
 		)
 	
 	def __eq__(self, other):
-		return isinstance(other, ID) and self.cdata == other.cdata
+		return isinstance(other, ID) and self._ptr_int == other._ptr_int
 	
 	def __ne__(self, other):
-		return not isinstance(other, ID) or self.cdata != other.cdata
+		return not isinstance(other, ID) or self._ptr_int != other._ptr_int
+	
+	def __hash__(self):
+		return self._ptr_int
 	
 	def responds_to(self, sel):
 		"""Return whether this object responds to the given selector.
@@ -1583,8 +1993,8 @@ class ID(object):
 		
 		sel = Selector(sel)
 		
-		if self.cls.instances_respond_to(b"respondsToSelector:"):
-			return bool(self.msg_send(b"respondsToSelector:", sel, check_responds=False))
+		if self.cls.instances_respond_to(_SEL_RESPONDS_TO_SELECTOR):
+			return bool(self.msg_send(_SEL_RESPONDS_TO_SELECTOR, sel, check_responds=False))
 		else:
 			return self.cls.instances_respond_to(sel)
 	
@@ -1596,7 +2006,13 @@ class ID(object):
 		
 		sel = Selector(sel)
 		
-		if check_responds and not self.responds_to(sel):
+		try:
+			method = self.cls.instance_methods[sel]
+		except KeyError:
+			method = None
+		
+		# If the class has a method for the selector, the object obviously responds to it, so the (comparatively slow) responds_to check is only needed for dynamically handled selectors.
+		if method is None and check_responds and not self.responds_to(sel):
 			if isinstance(self, MetaClass):
 				raise ValueError("Metaclass {self.name} does not respond to selector {sel.name_bytes!r}".format(self=self, sel=sel))
 			elif isinstance(self, Class):
@@ -1605,12 +2021,11 @@ class ID(object):
 				raise ValueError("{self.cls.name} instance at {self.cdata} does not respond to selector {sel.name_bytes!r}".format(self=self, sel=sel))
 		
 		if argtypes is None and restype is None:
-			try:
-				method = self.cls.instance_methods[sel]
-			except KeyError:
+			if method is None:
 				raise ValueError("No method found for selector {sel.name_bytes!r}, cannot infer restype and argtypes".format(sel=sel))
-			else:
-				restype, argtypes = method.decode_signature()
+			
+			restype, argtypes = method._get_signature()
+			coercers = method._get_arg_coercers()
 		elif argtypes is None or restype is None:
 			raise ValueError("restype and argtypes must be passed together")
 		else:
@@ -1618,23 +2033,12 @@ class ID(object):
 				restype = ffi.typeof(restype)
 			
 			argtypes = [ffi.typeof(at) if isinstance(at, str) else at for at in argtypes]
+			coercers = [_arg_coercer(tp) for tp in argtypes]
 		
-		new_args = []
-		for arg, tp in zip(args, argtypes):
-			if isinstance(arg, Class) and issubclass(tp, ffi.typeof("Class")):
-				new_args.append(ffi.cast("Class", arg.cdata))
-			elif isinstance(arg, (ID, Selector)):
-				new_args.append(arg.cdata)
-			elif issubclass(tp, ffi.typeof("id")):
-				try:
-					new_args.append(coerce(arg).cdata)
-				except TypeError:
-					new_args.append(arg)
-			else:
-				new_args.append(arg)
+		new_args = [coercer(arg) for coercer, arg in zip(coercers, args)]
 		
 		return unwrap_cdata(
-			_objc_msgSend(ffi.cast("id", self.cdata), sel.cdata, *new_args, restype=restype, argtypes=argtypes),
+			_objc_msgSend(ffi.cast(_TP_ID, self.cdata), sel.cdata, *new_args, restype=restype, argtypes=argtypes),
 			retain=_should_retain_result(sel),
 		)
 
@@ -1647,10 +2051,11 @@ class Class(ID):
 			self._cls = cls
 		
 		def _get_full(self):
-			count_ptr = ffi.new("unsigned int *")
-			ivars_ptr = gc_free(libc.class_copyIvarList(ffi.cast("Class", self._cls.cdata), count_ptr))
-			ivars = (Ivar(ivars_ptr[i]) for i in range(count_ptr[0]))
-			return collections.OrderedDict((ivar.name_bytes, ivar) for ivar in ivars)
+			count_ptr = _scratch_count_ptr()
+			ivars_ptr = gc_free(libc.class_copyIvarList(self._cls.as_class, count_ptr))
+			count = count_ptr[0]
+			ivars = [Ivar(ivars_ptr[i]) for i in range(count)]
+			return _OrderedDict([(ivar.name_bytes, ivar) for ivar in ivars])
 		
 		def __getitem__(self, key):
 			if isinstance(key, str):
@@ -1658,7 +2063,7 @@ class Class(ID):
 			elif not isinstance(key, bytes):
 				raise TypeError("{cls.__module__}.{cls.__qualname__} keys must be str or bytes".format(cls=type(self)))
 			
-			ivar = libc.class_getInstanceVariable(ffi.cast("Class", self._cls.cdata), key)
+			ivar = libc.class_getInstanceVariable(self._cls.as_class, key)
 			if ivar == ffi.NULL:
 				raise KeyError(key)
 			return Ivar(ivar)
@@ -1674,10 +2079,10 @@ class Class(ID):
 			self._cls = cls
 		
 		def __contains__(self, key):
-			return libc.class_getInstanceMethod(ffi.cast("Class", self._cls.cdata), Selector(key).cdata) != ffi.NULL
+			return libc.class_getInstanceMethod(self._cls.as_class, Selector(key).cdata) != ffi.NULL
 		
 		def __getitem__(self, key):
-			method = libc.class_getInstanceMethod(ffi.cast("Class", self._cls.cdata), Selector(key).cdata)
+			method = libc.class_getInstanceMethod(self._cls.as_class, Selector(key).cdata)
 			if method == ffi.NULL:
 				raise KeyError(key)
 			return Method(method)
@@ -1690,10 +2095,11 @@ class Class(ID):
 			self._cls = cls
 		
 		def _get_full(self):
-			count_ptr = ffi.new("unsigned int *")
-			methods_ptr = gc_free(libc.class_copyMethodList(ffi.cast("Class", self._cls.cdata), count_ptr))
-			methods = (Method(methods_ptr[i]) for i in range(count_ptr[0]))
-			return collections.OrderedDict((method.selector, method) for method in methods)
+			count_ptr = _scratch_count_ptr()
+			methods_ptr = gc_free(libc.class_copyMethodList(self._cls.as_class, count_ptr))
+			count = count_ptr[0]
+			methods = [Method(methods_ptr[i]) for i in range(count)]
+			return _OrderedDict([(method.selector, method) for method in methods])
 		
 		def __getitem__(self, key):
 			return self._get_cached()[Selector(key)]
@@ -1706,10 +2112,11 @@ class Class(ID):
 			self._cls = cls
 		
 		def _get_full(self):
-			count_ptr = ffi.new("unsigned int *")
-			properties_ptr = gc_free(libc.class_copyPropertyList(ffi.cast("Class", self._cls.cdata), count_ptr))
-			properties = (Property(properties_ptr[i]) for i in range(count_ptr[0]))
-			return collections.OrderedDict((prop.name_bytes, prop) for prop in properties)
+			count_ptr = _scratch_count_ptr()
+			properties_ptr = gc_free(libc.class_copyPropertyList(self._cls.as_class, count_ptr))
+			count = count_ptr[0]
+			properties = [Property(properties_ptr[i]) for i in range(count)]
+			return _OrderedDict([(prop.name_bytes, prop) for prop in properties])
 		
 		def __getitem__(self, key):
 			if isinstance(key, str):
@@ -1718,7 +2125,7 @@ class Class(ID):
 			if not isinstance(key, bytes):
 				raise TypeError("{cls.__module__}.{cls.__qualname__} keys must be str or bytes".format(cls=type(self)))
 			
-			prop = libc.class_getProperty(ffi.cast("Class", self._cls.cdata), key)
+			prop = libc.class_getProperty(self._cls.as_class, key)
 			if prop == ffi.NULL:
 				raise KeyError(key)
 			return Property(prop)
@@ -1729,11 +2136,23 @@ class Class(ID):
 		int,
 	)
 	
-	__slots__ = ("_instance_property_names", "instance_ivars_declared", "instance_methods", "instance_methods_declared", "instance_properties_declared")
+	__slots__ = ("_as_class_cached", "_instance_properties_cached", "_instance_property_names", "_public_method_names_cached", "_responds_cache", "_short_property_names_cached", "_superclass_cached", "instance_ivars_declared", "instance_methods", "instance_methods_declared", "instance_properties_declared")
+	
+	@property
+	def as_class(self):
+		"""The class's cdata, cast to Class."""
+		
+		# Use object.__getattribute__ to bypass ID.__getattr__, which would look for an Objective-C method of this name.
+		try:
+			return object.__getattribute__(self, "_as_class_cached")
+		except AttributeError:
+			as_class = ffi.cast(_TP_CLASS, self.cdata)
+			object.__setattr__(self, "_as_class_cached", as_class)
+			return as_class
 	
 	@property
 	def name_bytes(self):
-		return ffi.string(libc.class_getName(ffi.cast("Class", self.cdata)))
+		return ffi.string(libc.class_getName(self.as_class))
 	
 	@property
 	def name(self):
@@ -1741,7 +2160,7 @@ class Class(ID):
 	
 	@property
 	def instance_size(self):
-		return int(libc.class_getInstanceSize(ffi.cast("Class", self.cdata)))
+		return int(libc.class_getInstanceSize(self.as_class))
 	
 	@property
 	def instance_ivars(self):
@@ -1760,71 +2179,187 @@ class Class(ID):
 		try:
 			class_methods, instance_methods = data.PUBLIC_CLASS_METHODS[self.name]
 		except (KeyError, UnicodeDecodeError):
-			for sel in self.instance_methods_declared:
-				try:
-					name = sel.name
-				except UnicodeDecodeError:
-					continue
-				
-				##if not name.startswith("_"):
-				# Only include names that contain no underscores.
-				# This is necessary because the current method lookup algorithm simply replaces every _ with a : and tries to find a method with that name.
-				# This fails for methods that contain underscores in their name.
-				# As a nice side effect, this also hides any "private" methods (starting with an underscore).
-				if "_" not in name:
-					names.add(name)
+			names |= self._get_public_method_names()
 			
 			if SHORT_PROPERTIES:
-				for prop in self.instance_properties_declared.values():
-					try:
-						names.discard(prop.getter.name)
-					except ValueError:
-						print("Failed to get getter for property {}".format(prop))
-					except (AttributeError, UnicodeDecodeError):
-						pass
-					
-					try:
-						names.discard(prop.setter.name)
-					except ValueError:
-						print("Failed to get setter for property {}".format(prop))
-					except (AttributeError, UnicodeDecodeError):
-						pass
-				
-				for prop in self.instance_properties_declared.values():
-					try:
-						if "_" not in prop.name and "_" not in prop.getter.name and self.instances_respond_to(prop.getter):
-							names.add(prop.name)
-					except UnicodeDecodeError:
-						pass
+				accessor_names, property_names = self._get_short_property_names()
+				names -= accessor_names
+				names |= property_names
 		else:
 			names.update(class_methods if isinstance(self, MetaClass) else instance_methods)
 		
 		return names
 	
+	def _get_public_method_names(self):
+		"""Return a frozenset of the names (as str) of the public instance methods declared by this class.
+		
+		The set is built on first use and then stored on the class.
+		"""
+		
+		try:
+			return object.__getattribute__(self, "_public_method_names_cached")
+		except AttributeError:
+			pass
+		
+		names = set()
+		for sel in self.instance_methods_declared:
+			name_bytes = sel.name_bytes
+			##if not name_bytes.startswith(b"_"):
+			# Only include names that contain no underscores.
+			# This is necessary because the current method lookup algorithm simply replaces every _ with a : and tries to find a method with that name.
+			# This fails for methods that contain underscores in their name.
+			# As a nice side effect, this also hides any "private" methods (starting with an underscore).
+			# The check is done on the raw bytes, so names that are filtered out anyway are never decoded.
+			if b"_" not in name_bytes:
+				try:
+					names.add(name_bytes.decode("utf-8"))
+				except UnicodeDecodeError:
+					pass
+		
+		public_method_names = frozenset(names)
+		object.__setattr__(self, "_public_method_names_cached", public_method_names)
+		return public_method_names
+	
+	def _get_instance_property_names(self):
+		"""Return a frozenset of the names (as str) of all properties of this class's instances, including those declared by superclasses.
+		
+		The set is built on first use and then stored on the class. This can't be done in __new__, because at that point self.cls may not exist yet because of metaclasses and stuff.
+		"""
+		
+		try:
+			return object.__getattribute__(self, "_instance_property_names")
+		except AttributeError:
+			# The keys of instance_properties are the names as bytes, and already include the properties of all superclasses.
+			names = set()
+			for name_bytes in self.instance_properties:
+				try:
+					names.add(name_bytes.decode("utf-8"))
+				except UnicodeDecodeError:
+					# Such a property can't be set through attribute assignment anyway.
+					pass
+			
+			property_names = frozenset(names)
+			object.__setattr__(self, "_instance_property_names", property_names)
+			return property_names
+	
+	def _get_short_property_names(self):
+		"""Return a tuple (accessor_names, property_names) of frozensets for the SHORT_PROPERTIES handling in instance_attr_names_public.
+		
+		accessor_names are the names of the getters and setters of this class's declared properties, which are hidden from the public names. property_names are the names of the declared properties that are shown in their place. Both sets are built on first use and then stored on the class.
+		"""
+		
+		try:
+			return object.__getattribute__(self, "_short_property_names_cached")
+		except AttributeError:
+			pass
+		
+		accessor_names = set()
+		property_names = set()
+		
+		# The underscore checks are done on the raw name bytes. Names containing an underscore are never public, so they never need to be decoded.
+		for prop in self.instance_properties_declared.values():
+			# UnicodeDecodeError is a subclass of ValueError, so it has to be caught first.
+			# It can come from decoding the property's attribute encoding, or (for the setter) the property name.
+			try:
+				accessor_names.add(prop.getter.name_bytes)
+			except UnicodeDecodeError:
+				pass
+			except ValueError:
+				_log.debug("Failed to get getter for property %r", prop)
+			except AttributeError:
+				pass
+			
+			try:
+				accessor_names.add(prop.setter.name_bytes)
+			except UnicodeDecodeError:
+				pass
+			except ValueError:
+				_log.debug("Failed to get setter for property %r", prop)
+			except AttributeError:
+				pass
+		
+		for prop in self.instance_properties_declared.values():
+			name_bytes = prop.name_bytes
+			if b"_" in name_bytes:
+				continue
+			
+			try:
+				getter = prop.getter
+				if b"_" not in getter.name_bytes and self.instances_respond_to(getter):
+					property_names.add(name_bytes.decode("utf-8"))
+			except UnicodeDecodeError:
+				continue
+		
+		# Accessor names that aren't valid UTF-8 are decoded with surrogateescape - they are never among the public names, so they are simply never matched.
+		accessor_names = frozenset(name.decode("utf-8", "surrogateescape") for name in accessor_names if b"_" not in name)
+		property_names = frozenset(property_names)
+		
+		short_property_names = (accessor_names, property_names)
+		object.__setattr__(self, "_short_property_names_cached", short_property_names)
+		return short_property_names
+	
 	@property
 	def instance_properties(self):
-		if self.superclass is None:
-			return self.instance_properties_declared
-		else:
-			return MappingChain(self.superclass.instance_properties, self.instance_properties_declared)
+		# The chain is created only once per class, so that its flattened dict is only built once as well.
+		try:
+			return object.__getattribute__(self, "_instance_properties_cached")
+		except AttributeError:
+			if self.superclass is None:
+				instance_properties = self.instance_properties_declared
+			else:
+				instance_properties = MappingChain(self.superclass.instance_properties, self.instance_properties_declared)
+			object.__setattr__(self, "_instance_properties_cached", instance_properties)
+			return instance_properties
 	
 	@property
 	def protocols(self):
-		count_ptr = ffi.new("unsigned int *")
-		protocols_ptr = gc_free(libc.class_copyProtocolList(ffi.cast("Class", self.cdata), count_ptr))
-		ps = [Protocol(protocols_ptr[i]) for i in range(count_ptr[0])]
-		return ps
+		count_ptr = _scratch_count_ptr()
+		protocols_ptr = gc_free(libc.class_copyProtocolList(self.as_class, count_ptr))
+		count = count_ptr[0]
+		return [Protocol(protocols_ptr[i]) for i in range(count)]
 	
 	@property
 	def superclass(self):
-		return Class(libc.class_getSuperclass(ffi.cast("Class", self.cdata)))
+		# A class's superclass never changes, so it only needs to be looked up once.
+		try:
+			return object.__getattribute__(self, "_superclass_cached")
+		except AttributeError:
+			superclass_ptr = libc.class_getSuperclass(self.as_class)
+			if superclass_ptr == ffi.NULL:
+				superclass = None
+			elif isinstance(self, MetaClass):
+				# The superclass of the root metaclass is the root class, so it's not necessarily a metaclass.
+				superclass = Class(superclass_ptr)
+			else:
+				# The superclass of a normal class is always a normal class.
+				superclass = Class._wrap_raw(superclass_ptr)
+			object.__setattr__(self, "_superclass_cached", superclass)
+			return superclass
 	
 	@property
 	def version(self):
-		return int(libc.class_getVersion(ffi.cast("Class", self.cdata)))
+		return int(libc.class_getVersion(self.as_class))
 	
 	def __new__(cls, arg, retain=True):
-		if isinstance(arg, cls):
+		# Check for cdata first - it is by far the most common argument, as it is what the runtime functions return.
+		if isinstance(arg, Class._CTYPES):
+			arg = ffi.cast(_TP_ID, arg)
+			
+			if arg == ffi.NULL:
+				return None
+			
+			# Classes are process-wide singletons, so most of the time they have been wrapped before, and the runtime checks below can be skipped.
+			self = _cached_wrapper(cls, arg, retain)
+			if self is not None:
+				return self
+			elif not libc.object_isClass(arg):
+				raise ValueError("{!r} does not point to a class")
+			elif not issubclass(cls, MetaClass) and libc.class_isMetaClass(ffi.cast(_TP_CLASS, arg)):
+				# If arg points to a metaclass, return a MetaClass instead.
+				return MetaClass(ffi.cast(_TP_CLASS, arg), retain=retain)
+			else:
+				return cls._wrap_raw(arg, retain=retain)
+		elif isinstance(arg, cls):
 			if not retain:
 				_release(arg.cdata)
 			return arg
@@ -1835,43 +2370,32 @@ class Class(ID):
 			if cdata == ffi.NULL:
 				raise ValueError("No class named {}".format(arg))
 			return cls(cdata, retain=retain)
-		elif isinstance(arg, Class._CTYPES):
-			arg = ffi.cast("id", arg)
-			
-			if arg == ffi.NULL:
-				return None
-			elif not libc.object_isClass(arg):
-				raise ValueError("{!r} does not point to a class")
-			elif not issubclass(cls, MetaClass) and libc.class_isMetaClass(ffi.cast("Class", arg)):
-				# If arg points to a metaclass, return a MetaClass instead.
-				return MetaClass(ffi.cast("Class", arg), retain=retain)
-			else:
-				self = super().__new__(cls, arg, retain=retain)
-				
-				try:
-					object.__getattribute__(self, "_instance_property_names")
-				except AttributeError:
-					##self._instance_property_names = {prop.name for prop in self.instance_properties.values()}
-					object.__setattr__(self, "_instance_property_names", None)
-				
-				try:
-					object.__getattribute__(self, "instance_ivars_declared")
-				except AttributeError:
-					object.__setattr__(self, "instance_ivars_declared", Class._InstanceIvarsDeclared(self))
-					object.__setattr__(self, "instance_methods_declared", Class._InstanceMethodsDeclared(self))
-					object.__setattr__(self, "instance_methods", Class._InstanceMethods(self))
-					object.__setattr__(self, "instance_properties_declared", Class._InstancePropertiesDeclared(self))
-				
-				return self
 		elif isinstance(arg, objc_util.ObjCClass):
 			return Class(arg.ptr)
 		elif isinstance(arg, ctypes.c_void_p):
 			return Class(arg.value)
 		else:
-			raise TypeError("Expected a class name as str or bytes, an instance of {cls.__module__}.{cls.__qualname__} or objc_util.ObjCClass, or a Class-like cdata, not {tp.__module__}.{tp.__qualname__}".format(cls=cls, tp=type(arg)))
+			_raise_type_error(cls, arg, "a class name as str or bytes, an instance of {cls.__module__}.{cls.__qualname__} or objc_util.ObjCClass, or a Class-like cdata")
 				
 		assert False, "Someone forgot to return a thing"
 	
+	@classmethod
+	def _wrap_raw(cls, arg, retain=True):
+		"""Wrap the given non-NULL Class or id cdata as an instance of cls.
+		
+		Unlike the constructor, this does not ask the runtime whether arg points to a class, or whether it is a metaclass. Callers must already know that arg points to a metaclass if cls is MetaClass, and to a normal class otherwise.
+		"""
+		
+		return super().__new__(cls, arg, retain=retain)
+	
+	def _init_wrapper(self):
+		super()._init_wrapper()
+		object.__setattr__(self, "instance_ivars_declared", Class._InstanceIvarsDeclared(self))
+		object.__setattr__(self, "instance_methods_declared", Class._InstanceMethodsDeclared(self))
+		object.__setattr__(self, "instance_methods", Class._InstanceMethods(self))
+		object.__setattr__(self, "instance_properties_declared", Class._InstancePropertiesDeclared(self))
+		object.__setattr__(self, "_responds_cache", set())
+	
 	def __repr__(self):
 		try:
 			name = self.name
@@ -1883,8 +2407,8 @@ class Class(ID):
 		if not isinstance(subclass, Class):
 			raise TypeError("Argument 1 of issubclass(arg, {cls.__module__}.{cls.__qualname__}()) must be an objc.Class, not {tp.__module__}.{tp.__qualname__}".format(cls=type(self), tp=type(subclass)))
 		
-		if subclass.cls.instances_respond_to_api("isSubclassOfClass:"):
-			return bool(subclass.msg_send("isSubclassOfClass:", self))
+		if subclass.cls.instances_respond_to_api(_SEL_IS_SUBCLASS_OF_CLASS):
+			return bool(subclass.msg_send(_SEL_IS_SUBCLASS_OF_CLASS, self))
 		else:
 			while subclass is not None:
 				if self == subclass:
@@ -1896,8 +2420,8 @@ class Class(ID):
 	
 	def __instancecheck__(self, instance):
 		if isinstance(instance, ID):
-			if instance.cls.instances_respond_to_api("isKindOfClass:"):
-				return bool(instance.msg_send("isKindOfClass:", self))
+			if instance.cls.instances_respond_to_api(_SEL_IS_KIND_OF_CLASS):
+				return bool(instance.msg_send(_SEL_IS_KIND_OF_CLASS, self))
 			else:
 				return issubclass(instance.cls, self)
 		else:
@@ -1910,7 +2434,15 @@ class Class(ID):
 		"""
 		
 		sel = Selector(sel)
-		return bool(libc.class_respondsToSelector(ffi.cast("Class", self.cdata), sel.cdata))
+		# Only positive answers are cached - methods can be added to a class at runtime, but never removed.
+		responds_cache = object.__getattribute__(self, "_responds_cache")
+		if sel._ptr_int in responds_cache:
+			return True
+		elif libc.class_respondsToSelector(self.as_class, sel.cdata):
+			responds_cache.add(sel._ptr_int)
+			return True
+		else:
+			return False
 	
 	def instances_respond_to(self, sel):
 		"""Return whether instances of this class respond to the given selector.
@@ -1919,8 +2451,8 @@ class Class(ID):
 		"""
 		
 		sel = Selector(sel)
-		if self.cls.instances_respond_to_api(b"instancesRespondToSelector:"):
-			return bool(self.msg_send(b"instancesRespondToSelector:", sel, check_responds=False))
+		if self.cls.instances_respond_to_api(_SEL_INSTANCES_RESPOND_TO_SELECTOR):
+			return bool(self.msg_send(_SEL_INSTANCES_RESPOND_TO_SELECTOR, sel, check_responds=False))
 		else:
 			return self.instances_respond_to_api(sel)
 
@@ -1928,7 +2460,21 @@ class MetaClass(Class):
 	__slots__ = ()
 	
 	def __new__(cls, arg, retain=True):
-		if isinstance(arg, cls):
+		if isinstance(arg, MetaClass._CTYPES):
+			arg = ffi.cast(_TP_ID, arg)
+			
+			if arg == ffi.NULL:
+				return None
+			
+			self = _cached_wrapper(cls, arg, retain)
+			if self is not None:
+				return self
+			elif not libc.object_isClass(arg) or not libc.class_isMetaClass(ffi.cast(_TP_CLASS, arg)):
+				raise ValueError("Object pointer {!r} must point to a metaclass".format(arg))
+			else:
+				# arg has just been checked, so there's no need to let Class.__new__ check it again.
+				return cls._wrap_raw(arg, retain=retain)
+		elif isinstance(arg, cls):
 			if not retain:
 				_release(arg.cdata)
 			return arg
@@ -1937,17 +2483,8 @@ class MetaClass(Class):
 			if not retain:
 				_release(self.cdata)
 			return self
-		elif isinstance(arg, MetaClass._CTYPES):
-			arg = ffi.cast("id", arg)
-			
-			if arg == ffi.NULL:
-				return None
-			elif not libc.object_isClass(arg) or not libc.class_isMetaClass(ffi.cast("Class", arg)):
-				raise ValueError("Object pointer {!r} must point to a metaclass".format(arg))
-			else:
-				return super().__new__(cls, ffi.cast("Class", arg), retain=retain)
 		else:
-			raise TypeError("Expected a class name as str or bytes, a {cls.__module__}.{cls.__qualname__} instance, or a Class-like cdata, not {tp.__module__}.{tp.__qualname__}".format(cls=cls, tp=type(arg)))
+			_raise_type_error(cls, arg, "a class name as str or bytes, a {cls.__module__}.{cls.__qualname__} instance, or a Class-like cdata")
 				
 		assert False, "Someone forgot to return a thing"
 
@@ -1958,11 +2495,16 @@ class Protocol(ID):
 		int,
 	)
 	
-	__slots__ = ()
+	__slots__ = ("_name_bytes_cached", "_proto_cdata")
 	
 	@property
 	def name_bytes(self):
-		return ffi.string(libc.protocol_getName(ffi.cast("Protocol *", self.cdata)))
+		try:
+			return object.__getattribute__(self, "_name_bytes_cached")
+		except AttributeError:
+			name_bytes = ffi.string(libc.protocol_getName(self._proto_cdata))
+			object.__setattr__(self, "_name_bytes_cached", name_bytes)
+			return name_bytes
 	
 	@property
 	def name(self):
@@ -1970,13 +2512,26 @@ class Protocol(ID):
 	
 	@property
 	def protocols(self):
-		count_ptr = ffi.new("unsigned int *")
-		protocols_ptr = gc_free(libc.protocol_copyProtocolList(ffi.cast("Protocol *", self.cdata), count_ptr))
-		return [Protocol(protocols_ptr[i]) for i in range(count_ptr[0])]
-		return []
+		count_ptr = _scratch_count_ptr()
+		protocols_ptr = gc_free(libc.protocol_copyProtocolList(self._proto_cdata, count_ptr))
+		count = count_ptr[0]
+		return [Protocol(protocols_ptr[i]) for i in range(count)]
 	
 	def __new__(cls, arg, retain=True):
-		if isinstance(arg, cls):
+		if isinstance(arg, Protocol._CTYPES):
+			arg = ffi.cast(_TP_ID, arg)
+			
+			if arg == ffi.NULL:
+				return None
+			
+			self = _cached_wrapper(cls, arg, retain)
+			if self is not None:
+				return self
+			elif not _is_protocol(arg):
+				raise ValueError("Object pointer {arg!r} must point to a Protocol instance".format(arg=arg, self=self))
+			else:
+				return super().__new__(cls, arg, retain=retain)
+		elif isinstance(arg, cls):
 			if not retain:
 				_release(arg.cdata)
 			return arg
@@ -1987,17 +2542,8 @@ class Protocol(ID):
 			if cdata == ffi.NULL:
 				raise ValueError("No protocol named {}".format(arg))
 			return cls(cdata, retain=retain)
-		elif isinstance(arg, Protocol._CTYPES):
-			arg = ffi.cast("id", arg)
-			
-			if arg == ffi.NULL:
-				return None
-			elif not _is_protocol(arg):
-				raise ValueError("Object pointer {arg!r} must point to a Protocol instance".format(arg=arg, self=self))
-			else:
-				return super().__new__(cls, arg, retain=retain)
 		else:
-			raise TypeError("Expected a protocol name as str or bytes, a {cls.__module__}.{cls.__qualname__} instance, or a Protocol *-like cdata, not {tp.__module__}.{tp.__qualname__}".format(cls=cls, tp=type(arg)))
+			_raise_type_error(cls, arg, "a protocol name as str or bytes, a {cls.__module__}.{cls.__qualname__} instance, or a Protocol *-like cdata")
 				
 		assert False, "Someone forgot to return a thing"
 	
@@ -2008,51 +2554,74 @@ class Protocol(ID):
 			name = self.name_bytes
 		return "{cls.__module__}.{cls.__qualname__}({name!r})".format(cls=type(self), self=self, name=name)
 	
+	def _init_wrapper(self):
+		super()._init_wrapper()
+		# Cast once here, so the protocol_* functions can be called without casting every time.
+		object.__setattr__(self, "_proto_cdata", ffi.cast(_TP_PROTO_P, self.cdata))
+	
 	def __eq__(self, other):
-		return isinstance(other, Protocol) and bool(libc.protocol_isEqual(ffi.cast("Protocol *", self.cdata), ffi.cast("Protocol *", other.cdata)))
+		# Protocol pointers are almost always canonical, so only ask protocol_isEqual if the pointers differ.
+		return isinstance(other, Protocol) and (self._ptr_int == other._ptr_int or bool(libc.protocol_isEqual(self._proto_cdata, other._proto_cdata)))
 	
 	def __ne__(self, other):
-		return not isinstance(other, Protocol) or not libc.protocol_isEqual(ffi.cast("Protocol *", self.cdata), ffi.cast("Protocol *", other.cdata))
+		return not self.__eq__(other)
+	
+	def __hash__(self):
+		# protocol_isEqual considers two distinct Protocol objects equal if they have the same name, so the pointer can't be used as the hash.
+		return hash(self.name_bytes)
+	
+	def _adopted_by(self, start):
+		"""Return whether the given class or protocol adopts this protocol, directly or through any of its superclasses and adopted protocols.
+		
+		The inheritance graph is walked breadth-first, and every class and protocol in it is checked only once, even if it is reachable along several paths (as NSObject almost always is).
+		"""
+		
+		proto_p = self._proto_cdata
+		todo = collections.deque([start])
+		seen = {start}
+		
+		while todo:
+			node = todo.popleft()
+			
+			if isinstance(node, Class):
+				# See if node adopts self directly.
+				if libc.class_conformsToProtocol(node.as_class, proto_p):
+					return True
+				
+				superclass = node.superclass
+				if superclass is not None and superclass not in seen:
+					seen.add(superclass)
+					todo.append(superclass)
+			else:
+				# See if node adopts self directly.
+				if libc.protocol_conformsToProtocol(node._proto_cdata, proto_p):
+					return True
+			
+			# Queue the protocols directly adopted by node.
+			for proto in node.protocols:
+				if proto not in seen:
+					seen.add(proto)
+					todo.append(proto)
+		
+		return False
 	
 	def __subclasscheck__(self, subclass):
 		# Of course class_conformsToProtocol doesn't recursively check the superclass and adopted protocols, so we need to do that ourselves.
 		if isinstance(subclass, Class):
 			# Use the conformsToProtocol: method if possible.
-			if subclass.cls.instances_respond_to_api("conformsToProtocol:"):
-				return bool(subclass.msg_send("conformsToProtocol:", self))
+			if subclass.cls.instances_respond_to_api(_SEL_CONFORMS_TO_PROTOCOL):
+				return bool(subclass.msg_send(_SEL_CONFORMS_TO_PROTOCOL, self))
 			
-			# See if subclass adopts self directly.
-			if libc.class_conformsToProtocol(ffi.cast("Class", subclass.cdata), ffi.cast("Protocol *", self.cdata)):
-				return True
-			
-			# If subclass has a superclass, see if it conforms (directly or indirectly) to self.
-			if subclass.superclass is not None and issubclass(subclass.superclass, self):
-				return True
-			
-			# See if any of the protocols directly adopted by subclass conform (directly or indirectly) to self.
-			for proto in subclass.protocols:
-				if issubclass(proto, self):
-					return True
-			
-			return False
+			return self._adopted_by(subclass)
 		elif isinstance(subclass, Protocol):
-			# See if subclass adopts self directly.
-			if libc.protocol_conformsToProtocol(ffi.cast("Protocol *", subclass.cdata), ffi.cast("Protocol *", self.cdata)):
-				return True
-			
-			# See if any of the protocols directly adopted by subclass conform (directly or indirectly) to self.
-			for proto in subclass.protocols:
-				if issubclass(proto, self):
-					return True
-			
-			return False
+			return self._adopted_by(subclass)
 		else:
 			raise TypeError("Argument 1 of issubclass(arg, {cls.__module__}.{cls.__qualname__}()) must be an objc.Class or objc.Protocol, not {tp.__module__}.{tp.__qualname__}".format(cls=type(self), tp=type(subclass)))
 	
 	def __instancecheck__(self, instance):
 		if isinstance(instance, ID):
-			if instance.cls.instances_respond_to_api("conformsToProtocol:"):
-				return bool(instance.msg_send("conformsToProtocol:", self))
+			if instance.cls.instances_respond_to_api(_SEL_CONFORMS_TO_PROTOCOL):
+				return bool(instance.msg_send(_SEL_CONFORMS_TO_PROTOCOL, self))
 			else:
 				return issubclass(instance.cls, self)
 		else:
@@ -2062,21 +2631,22 @@ class Block(ID):
 	__slots__ = ("_descriptor", "_func", "_literal")
 	
 	def __new__(cls, func):
-		descriptor = ffi.new("struct Block_descriptor_1 *")
-		descriptor.reserved = 0
-		descriptor.size = ffi.sizeof("struct Block_literal_1")
-		descriptor.copy_helper = None
-		descriptor.dispose_helper = None
-		descriptor.signature = None
-		
-		literal = ffi.new("struct Block_literal_1 *")
-		literal.isa = ffi.cast("Class", classes.__NSGlobalBlock__.cdata)
-		literal.flags = libc.BLOCK_IS_GLOBAL
-		literal.reserved = 0
-		literal.invoke = ffi.cast("uncast_polymorphic_return (*)(id self, uncast_polymorphic_arguments args)", func)
-		literal.descriptor = descriptor
-		
-		self = super().__new__(ffi.cast("id", literal))
+		# Initialize the structs in one go, rather than setting each field separately.
+		descriptor = ffi.new("struct Block_descriptor *", {
+			"reserved": 0,
+			"size": ffi.sizeof("struct Block_literal"),
+		})
+		
+		literal = ffi.new("struct Block_literal *", {
+			"isa": _class("__NSGlobalBlock__"),
+			"flags": libc.BLOCK_IS_GLOBAL,
+			"reserved": 0,
+			"descriptor": descriptor,
+		})
+		# The ctypes backend doesn't support initializers for function pointer fields.
+		literal.invoke = ffi.cast(_TP_BLOCK_INVOKE, func)
+		
+		self = super().__new__(cls, ffi.cast(_TP_ID, literal))
 		object.__setattr__(self, "_descriptor", descriptor)
 		object.__setattr__(self, "_func", func)
 		object.__setattr__(self, "_literal", literal)
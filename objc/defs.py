@@ -2,24 +2,35 @@ from . import api
 
 __all__ = []
 
+# All declarations in this module are collected first and passed to a single cdef call, see the similar comment in api.
+_cdefs = []
+
+# Integer limits used by the constants below, computed once.
+# NSInteger and NSUInteger are typedefs for long and unsigned long, which aren't declared yet at this point.
+_NSINTEGER_BITS = 8*api.ffi.sizeof("long")
+_NSINTEGER_MAX = 2**(_NSINTEGER_BITS-1) - 1
+_NSINTEGER_MIN = -2**(_NSINTEGER_BITS-1)
+_NSUINTEGER_MAX = 2**_NSINTEGER_BITS - 1
+_INT_MAX = 2**(8*api.ffi.sizeof("int")-1) - 1
+
 #--- objc/NSObjCRuntime.h
-api.ffi.cdef("""
+_cdefs.append("""
 typedef long NSInteger;
 typedef unsigned long NSUInteger;
 """)
 
-api.ffi.cdef("""
+_cdefs.append("""
 #define NSIntegerMax {NSIntegerMax}L
 #define NSIntegerMin {NSIntegerMin}L
 #define NSUIntegerMax {NSUIntegerMax}L
 """.format(
-	NSIntegerMax=2**(8*api.ffi.sizeof("NSInteger")-1) - 1,
-	NSIntegerMin=-2**(8*api.ffi.sizeof("NSInteger")-1),
-	NSUIntegerMax=2**(8*api.ffi.sizeof("NSUInteger")) - 1,
+	NSIntegerMax=_NSINTEGER_MAX,
+	NSIntegerMin=_NSINTEGER_MIN,
+	NSUIntegerMax=_NSUINTEGER_MAX,
 ))
 
 #--- Foundation/NSObjCRuntime.h
-api.ffi.cdef("""
+_cdefs.append("""
 typedef id_s NSObject;
 typedef NSObject NSString;
 
@@ -72,18 +83,18 @@ enum {
 #define NO 0
 """)
 
-api.ffi.cdef("""
+_cdefs.append("""
 //static const NSInteger NSNotFound = NSIntegerMax;
-#define NSNotFound {api.libc.NSIntegerMax}
-""".format(api=api))
+#define NSNotFound {NSIntegerMax}
+""".format(NSIntegerMax=_NSINTEGER_MAX))
 
 #--- Foundation/NSZone.h
-api.ffi.cdef("""
+_cdefs.append("""
 typedef struct _NSZone NSZone;
 """)
 
 #--- Foundation/NSEnumerator.h
-api.ffi.cdef("""
+_cdefs.append("""
 typedef struct {
 	unsigned long state;
 	id *itemsPtr;
@@ -93,7 +104,7 @@ typedef struct {
 """)
 
 #--- Foundation/NSRange.h
-api.ffi.cdef("""
+_cdefs.append("""
 typedef struct _NSRange {
 	NSUInteger location;
 	NSUInteger length;
@@ -108,7 +119,7 @@ extern NSRange NSRangeFromString(NSString *aString);
 """)
 
 #--- Foundation/NSData.h
-api.ffi.cdef("""
+_cdefs.append("""
 typedef NSUInteger NSDataReadingOptions;
 enum {
 	NSDataReadingMappedIfSafe = 0x1, // 1UL << 0,
@@ -149,7 +160,7 @@ enum {
 """)
 
 #--- Foundation/NSError.h
-api.ffi.cdef("""
+_cdefs.append("""
 extern NSString */*const*/ NSCocoaErrorDomain;
 
 extern NSString */*const*/ NSPOSIXErrorDomain;
@@ -171,7 +182,7 @@ extern NSString */*const*/ NSFilePathErrorKey;
 """)
 
 #--- Foundation/NSString.h
-api.ffi.cdef("""
+_cdefs.append("""
 typedef unsigned short unichar;
 
 typedef NSUInteger NSStringCompareOptions;
@@ -255,42 +266,55 @@ extern NSString * /*const*/ NSCharacterConversionException;
 extern NSString * /*const*/ NSParseErrorException;
 """)
 
-api.ffi.cdef("""
+_cdefs.append("""
 //#define NSMaximumStringLength (INT_MAX-1)
 #define NSMaximumStringLength {}
-""".format((2**(8*api.ffi.sizeof("int")) - 1) - 1))
+""".format(_INT_MAX - 1))
 
-#--- Known classes and protocols
-# Access some classes to add them to the list of known classes
-
-api.protocols.NSCoding
-api.protocols.NSCopying
-api.protocols.NSDiscardableContent
-api.protocols.NSFastEnumeration
-api.protocols.NSMutableCopying
-api.protocols.NSObject
-api.protocols.NSSecureCoding
-
-api.classes.__NSGlobalBlock
-api.classes.__NSGlobalBlock__
-api.classes.__NSStackBlock
-api.classes.__NSStackBlock__
-api.classes.NSArray
-api.classes.NSBlock
-api.classes.NSCountedSet
-api.classes.NSData
-api.classes.NSDictionary
-api.classes.NSEnumerator
-api.classes.NSError
-api.classes.NSMutableArray
-api.classes.NSMutableData
-api.classes.NSMutableDictionary
-api.classes.NSMutableSet
-api.classes.NSMutableString
-api.classes.NSNumber
-api.classes.NSNull
-api.classes.NSObject
-api.classes.NSSet
-api.classes.NSString
-api.classes.NSValue
+api.ffi.cdef("\n".join(_cdefs))
+del _cdefs, _NSINTEGER_BITS, _NSINTEGER_MAX, _NSINTEGER_MIN, _NSUINTEGER_MAX, _INT_MAX
 
+#--- Known classes and protocols
+# Add some classes and protocols to the list of known names, so they show up in dir(objc.classes) and dir(objc.protocols).
+# Only the runtime is asked whether they exist - there's no need to create (and immediately throw away) wrappers for them, or to import objc.classes and objc.protocols before they are used.
+
+for _name in (
+	"NSCoding",
+	"NSCopying",
+	"NSDiscardableContent",
+	"NSFastEnumeration",
+	"NSMutableCopying",
+	"NSObject",
+	"NSSecureCoding",
+):
+	if api.libc.objc_getProtocol(_name.encode("utf-8")) != api.ffi.NULL:
+		api._preloaded_names["objc.protocols"].add(_name)
+
+for _name in (
+	"__NSGlobalBlock",
+	"__NSGlobalBlock__",
+	"__NSStackBlock",
+	"__NSStackBlock__",
+	"NSArray",
+	"NSBlock",
+	"NSCountedSet",
+	"NSData",
+	"NSDictionary",
+	"NSEnumerator",
+	"NSError",
+	"NSMutableArray",
+	"NSMutableData",
+	"NSMutableDictionary",
+	"NSMutableSet",
+	"NSMutableString",
+	"NSNumber",
+	"NSNull",
+	"NSObject",
+	"NSSet",
+	"NSString",
+	"NSValue",
+):
+	if api.libc.objc_getClass(_name.encode("utf-8")) != api.ffi.NULL:
+		api._preloaded_names["objc.classes"].add(_name)
+
+del _name
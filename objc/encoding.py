@@ -138,8 +138,53 @@ _SCALAR_ENCODING_MAP = {
 _SCALAR_ENCODING_RMAP = {v: k for k, v in _SCALAR_ENCODING_MAP.items()}
 _SCALAR_ENCODING_RMAP["char"] = _C_CHR
 
+# Names of the fields that make up each type's contents, as computed by _key_fields.
+_key_fields_cache = {}
+
+def _key_fields(tp):
+	"""Return a tuple of the names of all slots defined by the given BaseType subclass and its base classes, except for the cached hash."""
+	
+	try:
+		return _key_fields_cache[tp]
+	except KeyError:
+		fields = []
+		for base in reversed(tp.__mro__):
+			for name in base.__dict__.get("__slots__", ()):
+				if name != "_hash_cached" and name not in fields:
+					fields.append(name)
+		
+		fields = _key_fields_cache[tp] = tuple(fields)
+		return fields
+
 class BaseType(object):
-	__slots__ = ()
+	"""Base class of all decoded types.
+	
+	Types compare equal and hash by their contents, so equal types decoded from different encoding strings can share cache entries. Types should not be modified after they have been created.
+	"""
+	
+	__slots__ = ("_hash_cached",)
+	
+	def _key(self):
+		"""Return a tuple of this type's class and field values, which is used to compare and hash it. Lists are converted to tuples so the key is hashable."""
+		
+		key = [type(self)]
+		for name in _key_fields(type(self)):
+			value = getattr(self, name)
+			key.append(tuple(value) if isinstance(value, list) else value)
+		return tuple(key)
+	
+	def __eq__(self, other):
+		return self is other or (type(self) is type(other) and self._key() == other._key())
+	
+	def __ne__(self, other):
+		return not self == other
+	
+	def __hash__(self):
+		try:
+			return self._hash_cached
+		except AttributeError:
+			self._hash_cached = hash(self._key())
+			return self._hash_cached
 	
 	def encode(self):
 		raise NotImplementedError()